@@ -1,242 +1,2865 @@
-import wave
-import struct
-import math
-import numpy as np
-import pyaudio
-import threading
-import time
-import sys
-
-# Encoding and decoding parameters
-RATE = 44100        # Sampling rate
-DURATION = 0.01     # Duration of each bit in seconds
-FREQ_ONE = 19000    # Frequency for binary '1'
-FREQ_ZERO = 19500   # Frequency for binary '0'
-START_MARKER_FREQS = [15000, 17000, 15500, 17500, 15000, 17000, 15500, 17500]  # Sequence for start marker
-END_MARKER_FREQS = [20000, 17000, 20000, 17500, 15000, 17000, 20000, 17500]    # Sequence for end marker
-AMPLITUDE = 32767   # Max amplitude for 16-bit audio
-
-# PyAudio setup for real-time audio playback and recording
-p = pyaudio.PyAudio()
-
-# Function to encode data to audio file with start and end markers
-def encode_binary_to_audio(data, filename):
-    with wave.open(filename, 'w') as wav_file:
-        wav_file.setnchannels(1)  # Mono
-        wav_file.setsampwidth(2)  # 16-bit
-        wav_file.setframerate(RATE)
-        
-        # Add start marker
-        add_marker_to_audio(wav_file, START_MARKER_FREQS)
-
-        # Convert data to binary string
-        binary_data = ''.join(format(byte, '08b') for byte in data)
-        
-        # Encode each bit as a frequency
-        for bit in binary_data:
-            freq = FREQ_ONE if bit == '1' else FREQ_ZERO
-            encode_bit(wav_file, freq)
-        
-        # Add end marker
-        add_marker_to_audio(wav_file, END_MARKER_FREQS)
-
-    print(f"Encoding complete. Audio saved to {filename}")
-
-# Function to encode a single bit as a frequency in the WAV file
-def encode_bit(wav_file, freq):
-    samples = []
-    for i in range(int(RATE * DURATION)):
-        sample = AMPLITUDE * math.sin(2 * math.pi * freq * (i / RATE))
-        samples.append(int(sample))
-    wav_file.writeframes(struct.pack('<' + 'h' * len(samples), *samples))
-
-# Function to add a sequence of marker frequencies to the audio file (start or end)
-def add_marker_to_audio(wav_file, marker_freqs):
-    for marker_freq in marker_freqs:
-        samples = []
-        for i in range(int(RATE * DURATION)):
-            sample = AMPLITUDE * math.sin(2 * math.pi * marker_freq * (i / RATE))
-            samples.append(int(sample))
-        wav_file.writeframes(struct.pack('<' + 'h' * len(samples), *samples))
-
-# Function to detect and skip the entire marker sequence (start or end) from a file-based WAV
-def skip_marker_file_based(wav_file, marker_freqs):
-    frames_per_bit = int(RATE * DURATION)
-    marker_index = 0
-    while True:
-        frames = wav_file.readframes(frames_per_bit)
-        if not frames:
-            break
-
-        samples = np.frombuffer(frames, dtype=np.int16)
-        fft_result = np.fft.fft(samples)
-        freqs = np.fft.fftfreq(len(fft_result), 1 / RATE)
-        
-        peak_freq = abs(freqs[np.argmax(np.abs(fft_result))])
-        
-        # Check if the peak frequency matches the current marker
-        if abs(peak_freq - marker_freqs[marker_index]) < 500:  # Tolerance for marker frequency
-            marker_index += 1
-            if marker_index == len(marker_freqs):  # All markers found
-                break
-        else:
-            marker_index = 0  # Reset if the frequency does not match the expected marker
-
-# Function to detect and skip the entire marker sequence (start or end) in real-time
-def skip_marker_realtime(stream, marker_freqs):
-    frames_per_bit = int(RATE * DURATION)
-    marker_index = 0
-    while True:
-        frames = stream.read(1024)
-        samples = np.frombuffer(frames, dtype=np.int16)
-        fft_result = np.fft.fft(samples)
-        freqs = np.fft.fftfreq(len(fft_result), 1 / RATE)
-        
-        peak_freq = abs(freqs[np.argmax(np.abs(fft_result))])
-        
-        # Check if the peak frequency matches the current marker
-        if abs(peak_freq - marker_freqs[marker_index]) < 500:  # Tolerance for marker frequency
-            marker_index += 1
-            if marker_index == len(marker_freqs):  # All markers found
-                break
-        else:
-            marker_index = 0  # Reset if the frequency does not match the expected marker
-
-# Function to decode audio from a file (file-based decoding)
-def decode_audio_from_file(filename):
-    with wave.open(filename, 'r') as wav_file:
-        frames_per_bit = int(RATE * DURATION)
-        decoded_bits = []
-        
-        # First, read and skip the start marker
-        skip_marker_file_based(wav_file, START_MARKER_FREQS)
-
-        while True:
-            frames = wav_file.readframes(frames_per_bit)
-            if not frames:
-                break
-            
-            # Convert frames to numpy array
-            samples = np.frombuffer(frames, dtype=np.int16)
-            fft_result = np.fft.fft(samples)
-            freqs = np.fft.fftfreq(len(fft_result), 1 / RATE)
-            
-            # Find the dominant frequency
-            peak_freq = abs(freqs[np.argmax(np.abs(fft_result))])
-            
-            # Check for the end marker and stop decoding if found
-            if any(abs(peak_freq - freq) < 500 for freq in END_MARKER_FREQS):  # Tolerance for end marker frequencies
-                break
-
-            # Determine if it's a '1' or '0'
-            if abs(peak_freq - FREQ_ONE) < abs(peak_freq - FREQ_ZERO):
-                decoded_bits.append('1')
-            else:
-                decoded_bits.append('0')
-        
-        # Convert binary string to bytes
-        binary_string = ''.join(decoded_bits)
-        byte_chunks = [binary_string[i:i+8] for i in range(0, len(binary_string), 8)]
-        decoded_data = bytes(int(byte, 2) for byte in byte_chunks if len(byte) == 8)
-    
-    return decoded_data
-
-# Function to decode audio in real-time
-def decode_audio_in_real_time():
-    # Open a stream for audio recording
-    stream = p.open(format=pyaudio.paInt16,
-                    channels=1,
-                    rate=RATE,
-                    input=True,
-                    frames_per_buffer=1024)
-    
-    listening = False
-    decoded_bits = []
-    start_marker_detected = False
-
-    while True:
-        frames = stream.read(1024)
-        samples = np.frombuffer(frames, dtype=np.int16)
-        fft_result = np.fft.fft(samples)
-        freqs = np.fft.fftfreq(len(fft_result), 1 / RATE)
-        
-        # Find the dominant frequency
-        peak_freq = abs(freqs[np.argmax(np.abs(fft_result))])
-
-        # Check for start marker only after enough data is collected (avoid false positives)
-        if not start_marker_detected:
-            # Check if the start marker sequence is detected in order
-            skip_marker_realtime(stream, START_MARKER_FREQS)
-            print("Start marker detected. Starting data transmission...")
-            listening = True
-            decoded_bits = []  # Clear any previous data
-            start_marker_detected = True
-            time.sleep(1)  # Small delay to avoid false start detections
-        
-        # If we're listening, keep collecting the bits
-        if listening:
-            if any(abs(peak_freq - freq) < 500 for freq in END_MARKER_FREQS):
-                print("End marker detected. Stopping data transmission.")
-                break  # Stop when the end marker is detected
-            
-            if abs(peak_freq - FREQ_ONE) < abs(peak_freq - FREQ_ZERO):
-                decoded_bits.append('1')
-            else:
-                decoded_bits.append('0')
-    
-    # Close the stream after listening
-    stream.stop_stream()
-    stream.close()
-    
-    # Convert the decoded bits to bytes
-    binary_string = ''.join(decoded_bits)
-    byte_chunks = [binary_string[i:i+8] for i in range(0, len(binary_string), 8)]
-    decoded_data = bytes(int(byte, 2) for byte in byte_chunks if len(byte) == 8)
-    
-    print("Decoded data:", decoded_data)
-    return decoded_data
-
-# Save decoded data to a file
-def save_decoded_data(decoded_data):
-    filename = input("Enter the filename to save the decoded data: ").strip()
-    with open(filename, 'wb') as file:
-        file.write(decoded_data)
-    print(f"Decoded data saved to {filename}")
-
-# Main function to run encoding and decoding
-if __name__ == "__main__":
-    action = input("Select an action (1 = Encode, 2 = Decode): ").strip()
-    
-    if action == "1":
-        print("You selected encoding.")
-        
-        # Prompt user for the file to encode or real-time option
-        mode = input("Choose encoding mode (1 = Real-time, 2 = File-based): ").strip()
-        
-        if mode == "1":
-            input_data = input("Enter text data to encode: ").strip()
-            data_to_encode = input_data.encode('utf-8')
-            filename = input("Enter the filename to save the encoded audio: ").strip()
-            encode_binary_to_audio(data_to_encode, filename)
-        
-        elif mode == "2":
-            input_data_filename = input("Enter the filename to read binary data to encode: ").strip()
-            with open(input_data_filename, 'rb') as f:
-                data_to_encode = f.read()
-            filename = input("Enter the filename to save the encoded audio: ").strip()
-            encode_binary_to_audio(data_to_encode, filename)
-    
-    elif action == "2":
-        print("You selected decoding.")
-        
-        # Decode the audio from file or real-time
-        mode = input("Choose decoding mode (1 = Real-time, 2 = File-based): ").strip()
-        
-        if mode == "1":
-            decoded_data = decode_audio_in_real_time()
-            save_decoded_data(decoded_data)
-        
-        elif mode == "2":
-            filename = input("Enter the filename of the audio to decode: ").strip()
-            decoded_data = decode_audio_from_file(filename)
-            save_decoded_data(decoded_data)
+import wave
+import math
+import numpy as np
+import threading
+import time
+import sys
+import functools
+import mmap
+import os
+import struct
+import atexit
+import tempfile
+import json
+import zlib
+import lzma
+import bz2
+import itertools
+import concurrent.futures
+import argparse
+import contextlib
+import shutil
+
+# Encoding and decoding parameters
+RATE = 44100        # Sampling rate
+DURATION = 0.01     # Duration of each bit in seconds
+FREQ_ONE = 19000    # Frequency for binary '1'
+FREQ_ZERO = 19500   # Frequency for binary '0'
+START_MARKER_FREQS = [15000, 17000, 15500, 17500, 15000, 17000, 15500, 17500]  # Sequence for start marker
+END_MARKER_FREQS = [20000, 17000, 20000, 17500, 15000, 17000, 20000, 17500]    # Sequence for end marker
+AMPLITUDE = 32767   # Max amplitude for 16-bit audio
+
+MFSK_BAND = (18000, 19500)  # M-FSK data tones stay clear of the marker tones and their 500 Hz tolerance
+OFDM_SUBCARRIERS = 32  # Subcarriers per OFDM symbol, spaced at 1 / DURATION, each carrying one bit
+OFDM_FIRST_FREQ = 16000  # Frequency of the lowest OFDM subcarrier
+OFDM_CYCLIC_PREFIX = 0.0025  # Seconds copied from the end of each OFDM symbol to its front to absorb room echo
+DPSK_MODES = {'dbpsk': 1, 'dqpsk': 2}  # Bits per symbol of each differential PSK mode
+DPSK_CARRIER = 18500  # Carrier of the DPSK modes, between the data tones of binary FSK and the marker tones
+DPSK_SYMBOL_DURATION = 98 / RATE  # Default duration of each DPSK symbol (98 samples, about 2.2 ms, at 44.1 kHz)
+DPSK_RAMP = 0.225  # Fraction at the start of each DPSK symbol over which the phase glides to its new value
+PROFILE_CHUNK_ID = b'tssp'  # RIFF chunk in which the encoder stores the codec profile of a WAV file
+FRAME_MAGIC = b'TS'  # First bytes of every frame
+FRAME_HEADER = struct.Struct('>2sBIH')  # Frame header: magic, flags, payload length, check of the preceding fields
+FRAME_TRAILER = struct.Struct('>I')  # Frame trailer: CRC-32 of the payload
+FRAME_FLAG_FEC = 0x01  # Frame flag: the payload and its CRC are protected by Reed-Solomon codewords
+FRAME_CODECS = {'zlib': 0x02, 'lzma': 0x04, 'bz2': 0x06}  # Frame flag values of the payload compression codecs
+FRAME_CODEC_MASK = 0x06  # Frame flag bits holding the compression codec (0: not compressed)
+FRAME_FLAGS = FRAME_FLAG_FEC | FRAME_CODEC_MASK  # Flag bits this version understands
+COMPRESSION_TRIAL_SIZE = 64 << 10  # Bytes at the start of the data compressed with every codec to pick one
+MAX_DECOMPRESSED_SIZE = 256 << 20  # Bytes a compressed payload may expand to before its frame is rejected
+DECOMPRESSION_BLOCK = 1 << 20  # Bytes decompressed per step, so an oversized payload is caught near the limit
+RS_CODEWORD = 255  # Bytes per Reed-Solomon codeword (shorter codewords end a frame)
+RS_PARITY = 32  # Parity bytes per codeword, which correct up to 16 damaged bytes in it
+FEC_INTERLEAVE_DEPTH = 16  # Codewords interleaved together, so a burst of noise is spread over all of them
+FEC_HEADER_PARITY = 8  # Parity bytes protecting the header of a FEC frame
+FRAME_HEADER_BITS = 8 * (FRAME_HEADER.size + FEC_HEADER_PARITY)  # Decoded bits needed to read any frame header
+GOERTZEL_BATCH = 256  # Number of bit windows demodulated together by the Goertzel bank
+TIMING_BLOCK = 64  # Symbols demodulated between corrections of the symbol clock
+TIMING_GAIN = 0.25  # Fraction of the mean timing error of a block corrected after it
+TIMING_DRIFT_GAIN = 0.02  # Fraction of the mean timing error of a block added to the clock drift followed
+FREQUENCY_OFFSET_LIMIT = 0.01  # Largest relative offset of the received marker tones searched for
+FREQUENCY_ESTIMATE_FFT_SIZE = 8192  # Zero-padded FFT length over which each marker tone's frequency is measured
+FREQUENCY_SCALE_STEP = 1e-4  # Resolution the tones are retuned to, which bounds the Goertzel banks cached
+BATCHED_DECODE_ROWS = 16384  # Number of symbol rows transformed at once by the whole-file decoder
+ACQUISITION_BLOCK = 1 << 16  # Lags scored at once when correlating the input with a marker
+ACQUISITION_THRESHOLD = 0.15  # Normalized correlation a marker must reach (pure noise stays below about 0.1)
+END_MARKER_REJECTION = 0.85  # Fraction of a start marker's score at which its end marker score makes it an end marker
+PRESCAN_WINDOW = 1024  # Samples per probe window of the energy pre-scan that gates marker acquisition
+PRESCAN_BATCH = 1024  # Probe windows transformed together by the pre-scan
+PRESCAN_TONE_BINS = 2  # FFT bins on either side of each tone of a profile whose energy the pre-scan measures
+PRESCAN_FLOOR_PERCENTILE = 10  # Percentile of the tone energies of a scanned range taken as its noise floor
+PRESCAN_FLOOR_RATIO = 4  # Tone energy over the noise floor at which a probe may hold a transmission
+PRESCAN_TONE_DENSITY = 5  # Times its share of the spectrum a tone must hold of a probe's energy to do so in any case
+CAPTURE_FRAMES = 1024  # Frames delivered per PyAudio capture callback
+RING_BUFFER_SECONDS = 30  # Audio the ring buffer holds between the capture callback and the decoder
+RECEIVER_REPORT_SECONDS = 5  # Interval between receiver statistics reports while listening
+PLAYBACK_FRAMES = 4096  # Frames handed to PyAudio per write when playing a WAV file
+STREAM_SIZE = 0xFFFFFFFF  # RIFF and data chunk size written to pipes, whose length is unknown up front
+RIFF_SIZE_LIMIT = 0xFFFFFFFF  # Largest RIFF size a WAV header holds; larger files are written as RF64
+BATCH_MANIFEST = 'decode_manifest.jsonl'  # Manifest written by decode_batch, one JSON record per recording
+SHARD_SECONDS = 600  # Audio per shard when a long recording is searched for transmissions in parallel
+
+# PyAudio setup for real-time audio playback and recording
+# PyAudio is only imported and initialized the first time a real-time function needs it, so
+# encoding and decoding files costs no audio backend probing and works without a sound stack
+_pyaudio = None
+_audio = None
+
+# Function to get the PyAudio module and the shared PyAudio instance, initializing them on first use
+def get_audio_backend():
+    global _pyaudio, _audio
+    if _audio is None:
+        try:
+            import pyaudio
+        except ImportError as error:
+            raise ImportError("Real-time audio needs PyAudio (pip install pyaudio)") from error
+        _audio = pyaudio.PyAudio()
+        _pyaudio = pyaudio
+        atexit.register(_audio.terminate)
+    return _pyaudio, _audio
+
+# Growable bit buffer holding one bit per uint8, preallocated and doubled in capacity when it fills up
+class BitBuffer:
+    def __init__(self, capacity=8192):
+        self._bits = np.empty(capacity, dtype=np.uint8)
+        self._length = 0
+
+    def __len__(self):
+        return self._length
+
+    # Function to make room for a total of count bits up front
+    def reserve(self, count):
+        self._reserve(count - self._length)
+
+    # Function to make room for at least count more bits
+    def _reserve(self, count):
+        needed = self._length + count
+        if needed > len(self._bits):
+            grown = np.empty(max(needed, 2 * len(self._bits)), dtype=np.uint8)
+            grown[:self._length] = self._bits[:self._length]
+            self._bits = grown
+
+    def append(self, bit):
+        self._reserve(1)
+        self._bits[self._length] = bit
+        self._length += 1
+
+    def extend(self, bits):
+        bits = np.asarray(bits)
+        self._reserve(len(bits))
+        self._bits[self._length:self._length + len(bits)] = bits
+        self._length += len(bits)
+
+    def clear(self):
+        self._length = 0
+
+    # Function to get the buffered bits as an array view (valid until the next append)
+    def view(self):
+        return self._bits[:self._length]
+
+    # Function to pack the buffered bits into bytes, dropping a trailing incomplete byte
+    def to_bytes(self):
+        return bits_to_bytes(self.view())
+
+# Function to convert bytes (or any buffer) to an array of bits, most significant bit first
+def bytes_to_bits(data):
+    return np.unpackbits(np.frombuffer(data, dtype=np.uint8))
+
+# Function to convert an array of bits (most significant bit first) to bytes, dropping a trailing incomplete byte
+def bits_to_bytes(bits):
+    bits = np.asarray(bits, dtype=np.uint8)
+    return np.packbits(bits[:len(bits) - len(bits) % 8]).tobytes()
+
+# Function to group bits (most significant first) into symbols of bits_per_symbol bits
+def bits_to_symbols(bits, bits_per_symbol):
+    weights = 1 << np.arange(bits_per_symbol - 1, -1, -1)
+    return np.asarray(bits, dtype=np.uint8).reshape(-1, bits_per_symbol) @ weights
+
+# Function to expand symbols back into bits_per_symbol bits each, most significant first
+def symbols_to_bits(symbols, bits_per_symbol):
+    shifts = np.arange(bits_per_symbol - 1, -1, -1)
+    return ((np.asarray(symbols)[:, None] >> shifts) & 1).astype(np.uint8).ravel()
+
+# Function to get the data tones of an FSK mode, indexed by symbol value
+# mfsk=2 is the original binary mode (FREQ_ZERO for '0', FREQ_ONE for '1'); 4, 8 and 16 spread the
+# tones evenly over MFSK_BAND on multiples of the bin spacing of one symbol so they stay orthogonal
+def data_tones(mfsk=2, rate=RATE, duration=DURATION):
+    if mfsk == 2:
+        return [FREQ_ZERO, FREQ_ONE]
+    if mfsk not in (4, 8, 16):
+        raise ValueError("mfsk must be 2, 4, 8 or 16")
+    low, high = MFSK_BAND
+    bin_spacing = rate / round(rate * duration)
+    first_bin = math.ceil(low / bin_spacing)
+    spacing_bins = int((high - first_bin * bin_spacing) // (mfsk - 1) // bin_spacing)
+    if spacing_bins == 0:
+        raise ValueError(f"symbols of {duration * 1000:g} ms are too short for {mfsk} tones in MFSK_BAND")
+    return [(first_bin + i * spacing_bins) * bin_spacing for i in range(mfsk)]
+
+# Function to get the number of bits carried by one symbol of a mode with the given number of tones
+def bits_per_symbol(tones):
+    return len(tones).bit_length() - 1
+
+# Function to get the tones the demodulator evaluates: the data tones, then the marker tones
+def demod_tones(profile):
+    return profile.tones + profile.marker_tones
+
+# Codec profile: everything the encoder and the decoder have to agree on
+# rate is the sample rate, duration the length of one data symbol and marker_duration that of one marker tone (in
+# seconds); tones are the data tones (FSK, indexed by symbol value), the subcarriers (OFDM) or the carrier (DPSK)
+# The encoder stores the profile in a PROFILE_CHUNK_ID chunk of the WAV file, and the decoder configures itself from it
+class CodecProfile:
+    def __init__(self, modulation='fsk', mfsk=2, rate=RATE, duration=None, marker_duration=DURATION, tones=None,
+                 start_marker=START_MARKER_FREQS, end_marker=END_MARKER_FREQS):
+        if modulation != 'fsk' and modulation != 'ofdm' and modulation not in DPSK_MODES:
+            raise ValueError("modulation must be 'fsk', 'ofdm', 'dbpsk' or 'dqpsk'")
+        if duration is None:
+            duration = DPSK_SYMBOL_DURATION if modulation in DPSK_MODES else DURATION
+        if rate <= 0:
+            raise ValueError("sample rate must be positive")
+        frames_per_symbol = round(rate * duration)
+        frames_per_marker_tone = round(rate * marker_duration)
+        if frames_per_symbol < 1:
+            raise ValueError("symbol duration must be at least one sample")
+        if frames_per_marker_tone < 1:
+            raise ValueError("marker tone duration must be at least one sample")
+        if tones is None:
+            if modulation == 'fsk':
+                tones = data_tones(mfsk, rate, duration)
+            elif modulation == 'ofdm':
+                # Subcarriers sit on consecutive FFT bins of one symbol, so they are orthogonal; the bin of the
+                # first end marker tone stays free because the decoder watches it for the end of the data
+                bin_spacing = rate / frames_per_symbol
+                first_bin = round(OFDM_FIRST_FREQ / bin_spacing)
+                end_bin = round(end_marker[0] / bin_spacing)
+                bins = [b for b in range(first_bin, first_bin + OFDM_SUBCARRIERS + 1) if b != end_bin]
+                tones = [b * bin_spacing for b in bins[:OFDM_SUBCARRIERS]]
+            else:
+                tones = [DPSK_CARRIER]
+
+        self.modulation = modulation
+        self.rate = rate
+        self.duration = duration
+        self.marker_duration = marker_duration
+        self.tones = list(tones)
+        self.start_marker = list(start_marker)
+        self.end_marker = list(end_marker)
+        self.frames_per_symbol = frames_per_symbol
+        self.frames_per_marker_tone = frames_per_marker_tone
+        self.marker_tones = sorted(set(self.start_marker + self.end_marker))
+        self.scale = 1.0  # Ratio of the received frequencies to the nominal ones, set by scaled()
+
+        if modulation == 'fsk':
+            if len(self.tones) < 2 or len(self.tones) & (len(self.tones) - 1):
+                raise ValueError("an FSK profile needs a power of two data tones")
+            self.bits_per_symbol = bits_per_symbol(self.tones)
+        elif modulation == 'ofdm':
+            if round(self.end_marker[0] * frames_per_symbol / rate) in ofdm_bins(self):
+                raise ValueError("OFDM subcarriers must leave the bin of the first end marker tone free")
+            self.bits_per_symbol = len(self.tones)
+        else:
+            self.bits_per_symbol = DPSK_MODES[modulation]
+        if max(self.tones + self.marker_tones) >= rate / 2:
+            raise ValueError("every tone must lie below half the sample rate")
+
+    # Function to get the profile a receiver hears when every frequency comes out scale times the nominal one (as when
+    # the sender's sample clock runs that much faster); scale is rounded to FREQUENCY_SCALE_STEP, and the profile itself
+    # is returned when that leaves it at 1
+    def scaled(self, scale):
+        scale = 1 + round((scale - 1) / FREQUENCY_SCALE_STEP) * FREQUENCY_SCALE_STEP
+        if scale == 1:
+            return self
+        profile = CodecProfile(self.modulation, rate=self.rate, duration=self.duration,
+                               marker_duration=self.marker_duration, tones=[f * scale for f in self.tones],
+                               start_marker=[f * scale for f in self.start_marker],
+                               end_marker=[f * scale for f in self.end_marker])
+        profile.scale = scale
+        return profile
+
+    # Function to serialize the profile for the PROFILE_CHUNK_ID chunk
+    def to_json(self):
+        return json.dumps({'version': 1, 'modulation': self.modulation, 'rate': self.rate,
+                           'duration': self.duration, 'marker_duration': self.marker_duration, 'tones': self.tones,
+                           'start_marker': self.start_marker, 'end_marker': self.end_marker},
+                          separators=(',', ':')).encode('utf-8')
+
+    # Function to rebuild a profile from the contents of a PROFILE_CHUNK_ID chunk
+    @classmethod
+    def from_json(cls, data):
+        try:
+            fields = json.loads(data)
+            if fields['version'] != 1:
+                raise ValueError(f"unsupported codec profile version {fields['version']}")
+            return cls(fields['modulation'], rate=fields['rate'], duration=fields['duration'],
+                       marker_duration=fields['marker_duration'], tones=fields['tones'],
+                       start_marker=fields['start_marker'], end_marker=fields['end_marker'])
+        except (ValueError, KeyError, TypeError) as error:
+            raise wave.Error(f"invalid codec profile: {error}") from error
+
+# Profile of the original format: binary FSK with 10 ms symbols at 44.1 kHz
+DEFAULT_PROFILE = CodecProfile()
+
+# Number of input bytes read per block when encoding (one writeframes call per block)
+ENCODE_BLOCK_SIZE = 1024
+ENCODE_SPOOL_SIZE = 16 << 20  # Bytes of an unmeasurable input kept in memory before spooling to disk
+
+# Cache of precomputed int16 tone templates, keyed by frequency, sample rate and duration
+_tone_templates = {}
+
+# Function to get the int16 samples of one tone period of the given duration at the given frequency
+def tone_template(freq, rate=RATE, duration=DURATION):
+    key = (freq, rate, duration)
+    template = _tone_templates.get(key)
+    if template is None:
+        # Same per-sample expression as the original encoder so the output stays byte-identical
+        samples = [int(AMPLITUDE * math.sin(2 * math.pi * freq * (i / rate))) for i in range(round(rate * duration))]
+        template = np.array(samples, dtype='<i2')
+        _tone_templates[key] = template
+    return template
+
+# Function to render an array of symbols to little-endian 16-bit PCM frames, one data tone period per symbol
+def encode_symbols_to_frames(symbols, profile=DEFAULT_PROFILE):
+    # Row i is the tone for symbol value i; gathering by symbol builds the whole stream at once
+    table = np.stack([tone_template(freq, profile.rate, profile.duration) for freq in profile.tones])
+    return table[np.asarray(symbols, dtype=np.intp)].tobytes()
+
+# Function to split bytes, a file-like object or an iterator of bytes into blocks of at most block_size bytes
+def iter_byte_blocks(source, block_size=ENCODE_BLOCK_SIZE):
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = [source]
+    elif hasattr(source, 'read'):
+        source = iter(functools.partial(source.read, block_size), b'')
+    for piece in source:
+        piece = memoryview(piece).cast('B')
+        for i in range(0, len(piece), block_size):
+            yield piece[i:i + block_size]
+
+# Error raised when a decoded frame is truncated, cannot be corrected or fails its CRC
+class FrameError(ValueError):
+    pass
+
+# GF(256) arithmetic tables for the Reed-Solomon code (primitive polynomial x^8 + x^4 + x^3 + x^2 + 1, generator 2)
+# GF_MUL[a, b] is the product of a and b, so multiplying whole arrays of symbols is a single table lookup
+GF_EXP = np.zeros(512, dtype=np.intp)
+GF_LOG = np.zeros(256, dtype=np.intp)
+_value = 1
+for _power in range(255):
+    GF_EXP[_power] = _value
+    GF_LOG[_value] = _power
+    _value <<= 1
+    if _value & 0x100:
+        _value ^= 0x11D
+GF_EXP[255:] = GF_EXP[:257]
+GF_MUL = np.zeros((256, 256), dtype=np.uint8)
+GF_MUL[1:, 1:] = GF_EXP[GF_LOG[1:, None] + GF_LOG[None, 1:]]
+
+# Cache of Reed-Solomon generator polynomials, keyed by parity length
+_rs_generators = {}
+
+# Function to get the generator polynomial (highest degree first) with roots 2^0 ... 2^(parity - 1)
+def rs_generator(parity):
+    generator = _rs_generators.get(parity)
+    if generator is None:
+        generator = np.ones(1, dtype=np.uint8)
+        for i in range(parity):
+            generator = np.append(generator, 0) ^ np.insert(GF_MUL[generator, GF_EXP[i]], 0, 0)
+        _rs_generators[parity] = generator
+    return generator
+
+# Function to append parity bytes to every row of an (n, k) array of messages, giving (n, k + parity) codewords
+# The parity is the remainder of the message divided by the generator, computed for all rows at once
+def rs_encode(messages, parity=RS_PARITY):
+    taps = rs_generator(parity)[1:]
+    remainder = np.zeros((len(messages), parity), dtype=np.uint8)
+    for column in messages.T:
+        feedback = column ^ remainder[:, 0]
+        remainder[:, :-1] = remainder[:, 1:]
+        remainder[:, -1] = 0
+        remainder ^= GF_MUL[feedback[:, None], taps]
+    return np.concatenate((messages, remainder), axis=1)
+
+# Function to evaluate every codeword (row) at the roots of the generator; all zero means no errors
+def rs_syndromes(codewords, parity=RS_PARITY):
+    roots = GF_EXP[:parity]
+    syndromes = np.zeros((len(codewords), parity), dtype=np.uint8)
+    for column in codewords.T:
+        syndromes = GF_MUL[syndromes, roots] ^ column[:, None]
+    return syndromes
+
+# Function to correct the rows of an (n, length) array of codewords in place from their syndromes
+# Berlekamp-Massey, the Chien search and Forney's formula all run on every codeword at once
+# Returns a boolean array telling which codewords were corrected (the others have too many errors)
+def rs_correct(codewords, syndromes):
+    count, parity = syndromes.shape
+
+    # Berlekamp-Massey: the error locator polynomial of each codeword, lowest degree first
+    # shifted is the previous locator already multiplied by x^shift, so the update is a single multiply-add
+    locator = np.zeros((count, parity + 2), dtype=np.uint8)
+    locator[:, 0] = 1
+    shifted = np.roll(locator, 1, axis=1)
+    errors = np.zeros(count, dtype=np.intp)
+    scale = np.ones(count, dtype=np.intp)
+    for n in range(parity):
+        discrepancy = syndromes[:, n].copy()
+        if n:
+            discrepancy ^= np.bitwise_xor.reduce(GF_MUL[locator[:, 1:n + 1], syndromes[:, n - 1::-1]], axis=1)
+        factor = np.where(discrepancy > 0, GF_EXP[GF_LOG[discrepancy] - GF_LOG[scale] + 255], 0)
+        updated = locator ^ GF_MUL[factor[:, None], shifted]
+        swap = (discrepancy > 0) & (2 * errors <= n)
+        shifted = np.roll(np.where(swap[:, None], locator, shifted), 1, axis=1)
+        shifted[:, 0] = 0
+        errors = np.where(swap, n + 1 - errors, errors)
+        scale = np.where(swap, discrepancy, scale)
+        locator = updated
+
+    # Chien search: position p (counted from the end of the codeword) is in error if 2^-p is a root of the locator
+    powers = np.arange(codewords.shape[1])
+    values = np.zeros((count, len(powers)), dtype=np.uint8)
+    for i in range(parity // 2 + 1):
+        values ^= GF_MUL[locator[:, i, None], GF_EXP[(-i * powers) % 255]]
+    roots = values == 0
+    corrected = (errors <= parity // 2) & (np.count_nonzero(roots, axis=1) == errors)
+
+    # Forney: the error value at each root follows from the evaluator S(x) * locator(x) mod x^parity and the
+    # formal derivative of the locator (its odd terms)
+    evaluator = np.zeros((count, parity), dtype=np.uint8)
+    for i in range(parity // 2 + 1):
+        evaluator[:, i:] ^= GF_MUL[locator[:, i, None], syndromes[:, :parity - i]]
+    error_rows, positions = np.nonzero(roots & corrected[:, None])
+    inverse = (-positions) % 255
+    numerator = np.zeros(len(positions), dtype=np.uint8)
+    for i in range(parity):
+        numerator ^= GF_MUL[evaluator[error_rows, i], GF_EXP[(i * inverse) % 255]]
+    denominator = np.zeros(len(positions), dtype=np.uint8)
+    for i in range(1, parity // 2 + 1, 2):
+        denominator ^= GF_MUL[locator[error_rows, i], GF_EXP[((i - 1) * inverse) % 255]]
+    corrected[error_rows[denominator == 0]] = False
+    magnitude = np.where(numerator > 0, GF_EXP[(GF_LOG[numerator] - GF_LOG[denominator] + positions) % 255], 0)
+    keep = corrected[error_rows]
+    codewords[error_rows[keep], codewords.shape[1] - 1 - positions[keep]] ^= magnitude[keep].astype(np.uint8)
+
+    # A codeword with more errors than the code corrects can still yield a locator; its syndromes stay non-zero
+    corrected &= ~rs_syndromes(codewords, parity).any(axis=1)
+    return corrected
+
+# Function to correct every row of an (n, k + parity) array of codewords and return the (n, k) messages
+# Only codewords with non-zero syndromes go through the correction
+def rs_decode(codewords, parity=RS_PARITY):
+    codewords = np.array(codewords, dtype=np.uint8)
+    syndromes = rs_syndromes(codewords, parity)
+    damaged = np.flatnonzero(syndromes.any(axis=1))
+    if len(damaged):
+        repaired = codewords[damaged]
+        if not rs_correct(repaired, syndromes[damaged]).all():
+            raise FrameError("too many errors to correct")
+        codewords[damaged] = repaired
+    return codewords[:, :codewords.shape[1] - parity]
+
+# Function to get the layout of the last, shorter interleaver block of a FEC stream: (codewords, data bytes in each)
+# The block keeps the full interleaving depth with shortened codewords, so it corrects the same bursts as a full one
+# (a tail of fewer bytes than that gets one codeword per byte)
+def fec_tail_layout(remaining):
+    count = min(FEC_INTERLEAVE_DEPTH, remaining)
+    return count, -(-remaining // count)
+
+# Function to get the number of bytes FEC turns length bytes into
+def fec_encoded_length(length):
+    full, remaining = divmod(length, FEC_INTERLEAVE_DEPTH * (RS_CODEWORD - RS_PARITY))
+    size = full * FEC_INTERLEAVE_DEPTH * RS_CODEWORD
+    if remaining:
+        count, data_bytes = fec_tail_layout(remaining)
+        size += count * (data_bytes + RS_PARITY)
+    return size
+
+# Function to protect data with Reed-Solomon codewords and interleave them
+# Data fills blocks of FEC_INTERLEAVE_DEPTH full codewords, and what is left is spread evenly over one last block of
+# as many shortened codewords; each block is sent column by column, the first byte of every codeword, then the
+# second, ...
+def fec_encode(data):
+    data = np.frombuffer(data, dtype=np.uint8)
+    block = FEC_INTERLEAVE_DEPTH * (RS_CODEWORD - RS_PARITY)
+    full = len(data) // block * block
+    parts = []
+    if full:
+        codewords = rs_encode(data[:full].reshape(-1, RS_CODEWORD - RS_PARITY))
+        parts.append(codewords.reshape(-1, FEC_INTERLEAVE_DEPTH, RS_CODEWORD).transpose(0, 2, 1).ravel())
+    if full < len(data):
+        count, data_bytes = fec_tail_layout(len(data) - full)
+        messages = np.zeros(count * data_bytes, dtype=np.uint8)
+        messages[:len(data) - full] = data[full:]
+        parts.append(rs_encode(messages.reshape(count, data_bytes)).T.ravel())
+    return np.concatenate(parts).tobytes() if parts else b''
+
+# Function to de-interleave and correct the fec_encode() output for length bytes of data
+def fec_decode(data, length):
+    data = np.frombuffer(data, dtype=np.uint8)
+    block = FEC_INTERLEAVE_DEPTH * (RS_CODEWORD - RS_PARITY)
+    full = length // block
+    encoded_full = full * FEC_INTERLEAVE_DEPTH * RS_CODEWORD
+    parts = []
+    if full:
+        codewords = data[:encoded_full].reshape(full, RS_CODEWORD, FEC_INTERLEAVE_DEPTH).transpose(0, 2, 1)
+        parts.append(rs_decode(codewords.reshape(-1, RS_CODEWORD)).ravel())
+    if length > full * block:
+        count, data_bytes = fec_tail_layout(length - full * block)
+        codewords = data[encoded_full:encoded_full + count * (data_bytes + RS_PARITY)].reshape(-1, count).T
+        parts.append(rs_decode(codewords).ravel())
+    return np.concatenate(parts)[:length].tobytes() if parts else b''
+
+# Function to FEC-encode a stream of byte blocks, a batch of whole interleaver blocks at a time
+# Cutting the stream on interleaver block boundaries gives the same output as encoding it in one piece
+def iter_fec_blocks(blocks):
+    block = FEC_INTERLEAVE_DEPTH * (RS_CODEWORD - RS_PARITY)
+    pending = bytearray()
+    for piece in blocks:
+        pending += piece
+        if len(pending) >= 32 * block:  # About 110 kB per batch
+            whole = len(pending) // block * block
+            yield fec_encode(pending[:whole])
+            del pending[:whole]
+    yield fec_encode(pending)
+
+# Function to build the header of a frame carrying length payload bytes
+def frame_header(length, flags=0):
+    fields = FRAME_HEADER.pack(FRAME_MAGIC, flags, length, 0)[:-2]
+    return fields + struct.pack('>H', zlib.crc32(fields) & 0xFFFF)
+
+# Function to parse a frame header; returns (flags, payload length), or None if data does not start with one
+def parse_frame_header(data):
+    if len(data) < FRAME_HEADER.size:
+        return None
+    magic, flags, length, check = FRAME_HEADER.unpack_from(data)
+    if magic != FRAME_MAGIC or check != zlib.crc32(data[:FRAME_HEADER.size - 2]) & 0xFFFF:
+        return None
+    return flags, length
+
+# Function to find the length of data before sending it; returns the length and a source yielding the same bytes
+# Iterators and unseekable files are spooled to a temporary file first, so memory use stays bounded
+def measure_payload(data):
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        return memoryview(data).nbytes, data
+    if hasattr(data, 'seekable') and data.seekable():
+        start = data.tell()
+        length = data.seek(0, os.SEEK_END) - start
+        data.seek(start)
+        return length, data
+    spool = tempfile.SpooledTemporaryFile(max_size=ENCODE_SPOOL_SIZE)
+    for block in iter_byte_blocks(data):
+        spool.write(block)
+    length = spool.tell()
+    spool.seek(0)
+    return length, spool
+
+# Function to pick the codec that compresses the first COMPRESSION_TRIAL_SIZE bytes of the data best
+# Returns the codec (None if no codec makes them smaller) and a source yielding the same bytes as data
+def choose_codec(data):
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        head = bytes(memoryview(data).cast('B')[:COMPRESSION_TRIAL_SIZE])
+    elif hasattr(data, 'seekable') and data.seekable():
+        start = data.tell()
+        head = data.read(COMPRESSION_TRIAL_SIZE)
+        data.seek(start)
+    else:
+        # Put the bytes read for the trial back in front of the rest of the stream
+        blocks = iter_byte_blocks(data)
+        head = bytearray()
+        for block in blocks:
+            head += block
+            if len(head) >= COMPRESSION_TRIAL_SIZE:
+                break
+        data = itertools.chain([head], blocks)
+    sizes = {codec: len(compress_bytes(head, codec)) for codec in FRAME_CODECS}
+    codec = min(sizes, key=sizes.get)
+    return (codec if sizes[codec] < len(head) else None), data
+
+# Function to compress bytes in one go with a codec from FRAME_CODECS
+def compress_bytes(data, codec):
+    if codec == 'zlib':
+        return zlib.compress(data, 9)
+    if codec == 'lzma':
+        return lzma.compress(data)
+    return bz2.compress(data, 9)
+
+# Function to compress the data block by block into a temporary file, so memory use stays bounded
+# Returns the size of the data, the size of the compressed data and the temporary file, rewound
+def compress_payload(data, codec):
+    if codec == 'zlib':
+        compressor = zlib.compressobj(9)
+    elif codec == 'lzma':
+        compressor = lzma.LZMACompressor()
+    else:
+        compressor = bz2.BZ2Compressor(9)
+    spool = tempfile.SpooledTemporaryFile(max_size=ENCODE_SPOOL_SIZE)
+    size = 0
+    for block in iter_byte_blocks(data):
+        size += len(block)
+        spool.write(compressor.compress(block))
+    spool.write(compressor.flush())
+    length = spool.tell()
+    spool.seek(0)
+    return size, length, spool
+
+# Function to decompress the payload of a frame whose flags name a compression codec
+# A few hundred bytes of damaged or forged payload can expand to gigabytes, so no more than max_size bytes (by default
+# MAX_DECOMPRESSED_SIZE) are produced; a payload that would expand further raises FrameError
+def decompress_payload(payload, flags, max_size=None):
+    max_size = MAX_DECOMPRESSED_SIZE if max_size is None else max_size
+    codec = flags & FRAME_CODEC_MASK
+    if codec == FRAME_CODECS['zlib']:
+        decompressor = zlib.decompressobj()
+    elif codec == FRAME_CODECS['lzma']:
+        decompressor = lzma.LZMADecompressor()
+    else:
+        decompressor = bz2.BZ2Decompressor()
+    pieces = []
+    size = 0
+    while not decompressor.eof:
+        try:
+            piece = decompressor.decompress(payload, DECOMPRESSION_BLOCK)
+        except (zlib.error, lzma.LZMAError, OSError, EOFError) as error:
+            raise FrameError(f"compressed payload is damaged ({error})") from error
+        if not piece and not decompressor.eof:
+            raise FrameError("compressed payload is truncated")
+        size += len(piece)
+        if size > max_size:
+            raise FrameError(f"compressed payload expands past {max_size} bytes")
+        pieces.append(piece)
+        # zlib hands back the input it has not read yet; the others keep it until the next call
+        payload = getattr(decompressor, 'unconsumed_tail', b'')
+    return b''.join(pieces)
+
+# Function to wrap length bytes from source in a frame: header, payload blocks, then the CRC-32 of the payload
+# flags are the frame flags; with FRAME_FLAG_FEC the header gets FEC_HEADER_PARITY parity bytes, and the payload
+# and CRC are sent as fec_encode() output
+def iter_frame_blocks(source, length, flags=0):
+    header = frame_header(length, flags)
+    if flags & FRAME_FLAG_FEC:
+        yield rs_encode(np.frombuffer(header, dtype=np.uint8)[None, :], FEC_HEADER_PARITY).tobytes()
+        yield from iter_fec_blocks(iter_checked_payload(source, length))
+    else:
+        yield header
+        yield from iter_checked_payload(source, length)
+
+# Function to yield length bytes from source, then their CRC-32
+def iter_checked_payload(source, length):
+    crc = 0
+    sent = 0
+    for block in iter_byte_blocks(source):
+        crc = zlib.crc32(block, crc)
+        sent += len(block)
+        yield block
+    if sent != length:
+        raise ValueError(f"data changed size while encoding ({sent} bytes sent, {length} announced)")
+    yield FRAME_TRAILER.pack(crc)
+
+# Function to read the frame header at the start of decoded data
+# Returns (flags, payload length, header size), or None if data does not start with a frame
+def read_frame_header(data):
+    header = parse_frame_header(data)
+    if header is None and len(data) >= FRAME_HEADER_BITS // 8:
+        # A damaged header can still be repaired if it is the header of a FEC frame
+        codeword = np.frombuffer(data[:FRAME_HEADER_BITS // 8], dtype=np.uint8)
+        try:
+            header = parse_frame_header(rs_decode(codeword[None, :], FEC_HEADER_PARITY).tobytes())
+        except FrameError:
+            return None
+        if header is not None and not header[0] & FRAME_FLAG_FEC:
+            return None
+    if header is None:
+        return None
+    flags, length = header
+    return flags, length, FRAME_HEADER.size + (FEC_HEADER_PARITY if flags & FRAME_FLAG_FEC else 0)
+
+# Function to get the number of bytes sent after the header of a frame: the payload and its CRC, FEC-encoded or not
+def frame_body_length(flags, length):
+    if flags & FRAME_FLAG_FEC:
+        return fec_encoded_length(length + FRAME_TRAILER.size)
+    return length + FRAME_TRAILER.size
+
+# Function to get the total number of bits in a frame from its first decoded bits
+# Returns None if there are too few bits to tell yet, and 0 if the length is not known: raw data (framed False), or a
+# frame whose header is damaged, which is read on to the end marker and then rejected by unframe
+def frame_bit_count(bits, framed=True):
+    if not framed:
+        return 0
+    if len(bits) < FRAME_HEADER_BITS:
+        return None
+    header = read_frame_header(bits_to_bytes(bits[:FRAME_HEADER_BITS]))
+    if header is None:
+        return 0
+    flags, length, header_size = header
+    return 8 * (header_size + frame_body_length(flags, length))
+
+# Function to get the payload of decoded data: checked and unwrapped as a frame, or unchanged if framed is False
+# Whether the sender framed its data is not guessed from the data, which a damaged magic or raw data can fake either way
+# A compressed payload is decompressed to at most max_size bytes, as by decompress_payload
+def unframe(data, framed=True, max_size=None):
+    if not framed:
+        return data
+    header = read_frame_header(data)
+    if header is None:
+        if len(data) < FRAME_HEADER.size:
+            raise FrameError(f"frame is truncated ({len(data)} of {FRAME_HEADER.size} header bytes)")
+        raise FrameError("frame header is damaged")
+    flags, length, header_size = header
+    if flags & ~FRAME_FLAGS:
+        raise FrameError(f"unsupported frame flags {flags:#04x}")
+    end = header_size + frame_body_length(flags, length)
+    if len(data) < end:
+        raise FrameError(f"frame is truncated ({len(data)} of {end} bytes)")
+    body = data[header_size:end]
+    if flags & FRAME_FLAG_FEC:
+        body = fec_decode(body, length + FRAME_TRAILER.size)
+    payload = body[:length]
+    if FRAME_TRAILER.unpack_from(body, length)[0] != zlib.crc32(payload):
+        raise FrameError("frame CRC mismatch")
+    if flags & FRAME_CODEC_MASK:
+        return decompress_payload(payload, flags, max_size)
+    return payload
+
+# Function to get the FFT bins of the OFDM subcarriers (the FFT spans one symbol, so bins are 1 / duration apart)
+def ofdm_bins(profile):
+    return np.rint(np.asarray(profile.tones) * profile.frames_per_symbol / profile.rate).astype(np.intp)
+
+# Function to get the length in samples of the OFDM cyclic prefix, which is never longer than a symbol
+def ofdm_prefix(profile):
+    return min(round(OFDM_CYCLIC_PREFIX * profile.rate), profile.frames_per_symbol)
+
+# Modulator for the FSK modes: one tone period per symbol, no state between symbols
+class FskModulator:
+    def __init__(self, profile):
+        self.profile = profile
+        self.bits_per_symbol = profile.bits_per_symbol
+
+    # Function to get the frames sent between the start marker and the data
+    def preamble(self):
+        return b''
+
+    # Function to render bits (a whole number of symbols) to frames
+    def modulate(self, bits):
+        return encode_symbols_to_frames(bits_to_symbols(bits, self.bits_per_symbol), self.profile)
+
+    # Function to render the bits left over at the end (fewer than one symbol)
+    # They are padded with zero bits, which the decoder drops as an incomplete byte
+    def flush(self, bits):
+        return self.modulate(np.concatenate((bits, np.zeros(self.bits_per_symbol - len(bits), dtype=np.uint8))))
+
+# Modulator for the multicarrier mode: every symbol carries one bit on each of the profile's orthogonal subcarriers
+# Each bit flips (1) or keeps (0) the phase of its subcarrier relative to the previous symbol (differential BPSK),
+# so the receiver needs no channel estimate; a reference symbol after the start marker sets the initial phases
+class OfdmModulator:
+    def __init__(self, profile):
+        self.bits_per_symbol = profile.bits_per_symbol
+        self._bins = ofdm_bins(profile)
+        self._frames = profile.frames_per_symbol
+        self._prefix = ofdm_prefix(profile)
+        # Quadratic +-1 phase pattern for the reference symbol, which keeps its peak lower than all-equal phases
+        index = np.arange(self.bits_per_symbol)
+        self._phases = 1 - 2 * ((index * (index + 1) // 2) % 2)
+
+    def preamble(self):
+        return self._render(self._phases[None, :])
+
+    def modulate(self, bits):
+        flips = 1 - 2 * np.asarray(bits, dtype=np.int8).reshape(-1, self.bits_per_symbol)
+        phases = self._phases * np.cumprod(flips, axis=0)
+        self._phases = phases[-1]
+        return self._render(phases)
+
+    # Function to render the bits left over at the end (fewer than one symbol)
+    # Subcarriers without a bit stay silent, which tells the decoder where the data stops
+    def flush(self, bits):
+        phases = self._phases.copy()
+        phases[:len(bits)] *= 1 - 2 * np.asarray(bits, dtype=np.int8)
+        phases[len(bits):] = 0
+        return self._render(phases[None, :])
+
+    # Function to synthesize one OFDM symbol per row of subcarrier phases with a single inverse FFT
+    def _render(self, phases):
+        n = self._frames
+        spectrum = np.zeros((len(phases), n // 2 + 1), dtype=np.complex128)
+        spectrum[:, self._bins] = phases
+        # Each subcarrier gets AMPLITUDE / (number of subcarriers), so the sum can never clip
+        body = np.fft.irfft(spectrum, n, axis=1) * (AMPLITUDE * n / (2 * self.bits_per_symbol))
+        symbols = np.concatenate((body[:, n - self._prefix:], body), axis=1)
+        return np.rint(symbols).astype('<i2').tobytes()
+
+# Function to get the phase step of each DPSK symbol value; DQPSK steps are Gray-coded so neighbours differ by one bit
+def dpsk_phase_steps(bits_per_symbol):
+    if bits_per_symbol == 1:
+        return np.array([0, np.pi])
+    return np.array([0, np.pi / 2, -np.pi / 2, np.pi])
+
+# Modulator for the differential PSK modes: a single carrier whose phase steps by dpsk_phase_steps() every symbol
+# The carrier is synthesized from one running sample clock, so it never restarts at phase 0 between calls, and each
+# phase step glides over the first DPSK_RAMP of the symbol instead of jumping, which keeps the spectrum narrow
+class DpskModulator:
+    def __init__(self, profile):
+        self.bits_per_symbol = profile.bits_per_symbol
+        self._steps = dpsk_phase_steps(self.bits_per_symbol)
+        self._carrier = profile.tones[0]
+        self._rate = profile.rate
+        self._phase = 0.0  # Phase of the last symbol sent
+        self._clock = 0  # Carrier sample clock
+        frames = profile.frames_per_symbol
+        self._ramp = np.minimum(np.arange(frames) / round(DPSK_RAMP * frames), 1)
+
+    # Function to get the reference symbol the first data symbol is compared against
+    def preamble(self):
+        return self._render(np.zeros(1))
+
+    def modulate(self, bits):
+        return self._render(self._steps[bits_to_symbols(bits, self.bits_per_symbol)])
+
+    # Function to render the bits left over at the end (fewer than one symbol), padded with zero bits
+    def flush(self, bits):
+        return self.modulate(np.concatenate((bits, np.zeros(self.bits_per_symbol - len(bits), dtype=np.uint8))))
+
+    # Function to synthesize one symbol per phase step
+    def _render(self, steps):
+        starts = self._phase + np.concatenate(([0], np.cumsum(steps)[:-1]))
+        self._phase = (self._phase + np.sum(steps)) % (2 * np.pi)
+        offsets = starts[:, None] + steps[:, None] * self._ramp
+        clock = self._clock + np.arange(offsets.size)
+        self._clock += offsets.size
+        carrier = 2 * np.pi * self._carrier * clock / self._rate + offsets.ravel()
+        return np.rint(AMPLITUDE * np.sin(carrier)).astype('<i2').tobytes()
+
+# WAV writer for outputs that cannot seek back, such as pipes: the header goes out first with the sizes set to
+# STREAM_SIZE, as streaming recorders do, and the codec profile chunk goes before the audio since nothing may follow it
+class StreamingWavWriter:
+    def __init__(self, file, profile):
+        self._file = file
+        body = profile.to_json()
+        fmt = struct.pack('<HHIIHH', 1, 1, profile.rate, 2 * profile.rate, 2, 16)  # Mono 16-bit PCM
+        file.write(b'RIFF' + struct.pack('<I', STREAM_SIZE) + b'WAVE'
+                   + struct.pack('<4sI', b'fmt ', len(fmt)) + fmt
+                   + struct.pack('<4sI', PROFILE_CHUNK_ID, len(body)) + body + b'\0' * (len(body) & 1)
+                   + struct.pack('<4sI', b'data', STREAM_SIZE))
+
+    def writeframes(self, data):
+        self._file.write(data)
+
+    def close(self):
+        self._file.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+# WAV writer for files: the audio is followed by the codec profile chunk, and the sizes are filled in on close
+# A JUNK chunk holds the place of a ds64 chunk, so a file whose RIFF size passes RIFF_SIZE_LIMIT (4 GiB) becomes
+# RF64 in place, with its 64-bit sizes in the ds64 chunk and the 32-bit ones set to STREAM_SIZE
+class WavFileWriter:
+    def __init__(self, filename, profile):
+        self._file = open(filename, 'wb')
+        self._profile = profile
+        self._data_size = 0
+        fmt = struct.pack('<HHIIHH', 1, 1, profile.rate, 2 * profile.rate, 2, 16)  # Mono 16-bit PCM
+        try:
+            self._file.write(b'RIFF' + struct.pack('<I', 0) + b'WAVE'
+                             + struct.pack('<4sI', b'JUNK', 28) + bytes(28)
+                             + struct.pack('<4sI', b'fmt ', len(fmt)) + fmt
+                             + struct.pack('<4sI', b'data', 0))
+        except BaseException:
+            self._file.close()
+            raise
+        self._data_offset = self._file.tell()
+
+    def writeframes(self, data):
+        self._file.write(data)
+        self._data_size += len(data)
+
+    def close(self):
+        if self._file.closed:
+            return
+        try:
+            body = self._profile.to_json()
+            self._file.write(struct.pack('<4sI', PROFILE_CHUNK_ID, len(body)) + body + b'\0' * (len(body) & 1))
+            riff_size = self._file.tell() - 8
+            if riff_size > RIFF_SIZE_LIMIT:
+                self._file.seek(0)
+                self._file.write(b'RF64' + struct.pack('<I', STREAM_SIZE) + b'WAVE'
+                                 + struct.pack('<4sIQQQI', b'ds64', 28, riff_size, self._data_size,
+                                               self._data_size // 2, 0))
+                data_size = STREAM_SIZE
+            else:
+                self._file.seek(4)
+                self._file.write(struct.pack('<I', riff_size))
+                data_size = self._data_size
+            self._file.seek(self._data_offset - 4)
+            self._file.write(struct.pack('<I', data_size))
+        finally:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+# Function to open the encoder output: a WavFileWriter on a file by name, or a StreamingWavWriter on a writable binary
+# file object
+def open_wav_output(output, profile):
+    if hasattr(output, 'write'):
+        return StreamingWavWriter(output, profile)
+    return WavFileWriter(output, profile)
+
+# Streaming encoder: turns data into 16-bit PCM chunks, with no file, sound card or printing attached
+# The codec profile (or mfsk and modulation) and the frame options are fixed per encoder, and encode() can be called
+# for any number of transmissions; after each one, codec, payload_size and sent_size describe what was sent
+class Encoder:
+    __slots__ = ('profile', 'framed', 'fec', 'compress', 'codec', 'payload_size', 'sent_size')
+
+    def __init__(self, profile=None, mfsk=2, modulation='fsk', framed=True, fec=False, compress=None):
+        if (fec or compress) and not framed:
+            raise ValueError("fec and compress need framed data")
+        if compress not in (None, 'auto') and compress not in FRAME_CODECS:
+            raise ValueError(f"unknown compression codec {compress!r}")
+        self.profile = CodecProfile(modulation, mfsk) if profile is None else profile
+        self.framed = framed
+        self.fec = fec
+        self.compress = compress
+        self.codec = None  # Compression codec of the last transmission, None if it was not compressed
+        self.payload_size = None  # Bytes of data in the last transmission (None for raw data)
+        self.sent_size = None  # Bytes of payload the last frame carried, after compression
+
+    # Function to yield the PCM chunks (little-endian int16 samples, as bytes) of one transmission of data
+    # data is bytes, a file-like object or an iterator of bytes, and is read block by block as chunks are taken
+    def encode(self, data):
+        profile = self.profile
+        if profile.modulation == 'fsk':
+            modulator = FskModulator(profile)
+        elif profile.modulation == 'ofdm':
+            modulator = OfdmModulator(profile)
+        else:
+            modulator = DpskModulator(profile)
+        symbol_bits = modulator.bits_per_symbol
+        self.codec = self.payload_size = self.sent_size = None
+        source = data
+        spool = None  # Temporary copy of the data, if it had to be spooled to measure its length
+        try:
+            if self.framed:
+                flags = FRAME_FLAG_FEC if self.fec else 0
+                codec = self.compress
+                if codec == 'auto':
+                    codec, data = choose_codec(data)
+                if codec is None:
+                    length, payload = measure_payload(data)
+                    if payload is not data:
+                        spool = payload
+                    self.payload_size = length
+                else:
+                    flags |= FRAME_CODECS[codec]
+                    self.payload_size, length, payload = compress_payload(data, codec)
+                    spool = payload
+                    self.codec = codec
+                self.sent_size = length
+                source = iter_frame_blocks(payload, length, flags)
+
+            # Start marker
+            yield marker_frames(profile.start_marker, profile)
+            yield modulator.preamble()
+
+            # Read the data block by block so memory use does not grow with the input size
+            pending = np.empty(0, dtype=np.uint8)  # Bits left over that do not fill a whole symbol yet
+            for block in iter_byte_blocks(source):
+                # Convert the block to an array of bits, most significant bit first
+                bits = np.concatenate((pending, bytes_to_bits(block)))
+                whole = len(bits) - len(bits) % symbol_bits
+                if whole:
+                    yield modulator.modulate(bits[:whole])
+                pending = bits[whole:]
+
+            # Send the bits that do not fill a whole symbol
+            if len(pending):
+                yield modulator.flush(pending)
+
+            # End marker
+            yield marker_frames(profile.end_marker, profile)
+        finally:
+            if spool is not None:
+                spool.close()
+
+    # Function to get the airtime in seconds that compression saved on the last transmission
+    def airtime_saved(self):
+        if self.codec is None:
+            return 0.0
+        flags = FRAME_FLAG_FEC if self.fec else 0
+        seconds_per_byte = 8 / self.profile.bits_per_symbol * self.profile.frames_per_symbol / self.profile.rate
+        saved_bytes = frame_body_length(flags, self.payload_size) - frame_body_length(flags, self.sent_size)
+        return saved_bytes * seconds_per_byte
+
+# Function to encode data (bytes, file-like object or iterator of bytes) to audio file with start and end markers
+# filename may also be a writable binary file object (such as sys.stdout.buffer), which gets a streamed WAV
+# modulation is 'fsk' (mfsk selects 2, 4, 8 or 16 data tones, each symbol carrying log2(mfsk) bits), 'ofdm',
+# 'dbpsk' or 'dqpsk'; a CodecProfile passed as profile replaces both and also sets sample rate, timing and tones
+# The data is sent as a frame (length header, payload, CRC-32) unless framed is False; fec adds Reed-Solomon
+# codewords to the frame, which let the decoder repair damaged bytes
+# compress is a codec from FRAME_CODECS, or 'auto' to pick the codec that shortens the data most (or none)
+def encode_binary_to_audio(data, filename, mfsk=2, modulation='fsk', profile=None, framed=True, fec=False,
+                           compress=None):
+    encoder = Encoder(profile, mfsk, modulation, framed, fec, compress)
+    with open_wav_output(filename, encoder.profile) as wav_file:
+        for chunk in encoder.encode(data):
+            wav_file.writeframes(chunk)
+
+    if encoder.codec is not None:
+        print(f"Compressed {encoder.payload_size} bytes to {encoder.sent_size} with {encoder.codec}, "
+              f"saving {encoder.airtime_saved():.1f} s of airtime")
+    elif compress == 'auto':
+        print("Compression would not shorten the data; it was sent uncompressed")
+    if hasattr(filename, 'write'):
+        print(f"Encoding complete. Audio written to {getattr(filename, 'name', 'the stream')}")
+    else:
+        print(f"Encoding complete. Audio saved to {filename}")
+
+# Function to encode a single bit as a frequency in the WAV file
+def encode_bit(wav_file, freq):
+    wav_file.writeframes(tone_template(freq).tobytes())
+
+# Function to get the PCM frames (as bytes) of a sequence of marker frequencies (start or end)
+def marker_frames(marker_freqs, profile=DEFAULT_PROFILE):
+    tones = [tone_template(freq, profile.rate, profile.marker_duration) for freq in marker_freqs]
+    return np.concatenate(tones).tobytes()
+
+# Function to add a sequence of marker frequencies to the audio file (start or end)
+def add_marker_to_audio(wav_file, marker_freqs, profile=DEFAULT_PROFILE):
+    wav_file.writeframes(marker_frames(marker_freqs, profile))
+
+# Memory-mapped WAV reader: parses the RIFF header itself and hands out NumPy views over the data chunk
+# Same reading interface as wave.Wave_read, except that readframes returns an int16 array view instead of bytes
+class MappedWav:
+    def __init__(self, filename):
+        self._file = open(filename, 'rb')
+        try:
+            if os.fstat(self._file.fileno()).st_size == 0:
+                raise wave.Error("file is empty")
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            # The decoders walk the file front to back, so ask for aggressive read-ahead
+            if hasattr(self._map, 'madvise'):
+                self._map.madvise(mmap.MADV_SEQUENTIAL)
+            if hasattr(os, 'posix_fadvise'):
+                os.posix_fadvise(self._file.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+            self._parse_header()
+        except BaseException:
+            self.close()
+            raise
+        self._pos = 0
+
+    # Function to walk the RIFF (or RF64) chunks and locate the format, data and codec profile chunks
+    def _parse_header(self):
+        data = self._map
+
+        # Function to unpack a structure at offset, raising wave.Error if the file ends first
+        def unpack(layout, offset, what):
+            if offset + struct.calcsize(layout) > len(data):
+                raise wave.Error(f"{what} is truncated")
+            return struct.unpack_from(layout, data, offset)
+
+        riff_id, riff_size, wave_id = unpack('<4sI4s', 0, "RIFF header")
+        if riff_id not in (b'RIFF', b'RF64') or wave_id != b'WAVE':
+            raise wave.Error("file does not start with RIFF id")
+        fmt = None
+        data_offset = None
+        data_size_64 = None
+        self.profile_data = None  # Contents of the PROFILE_CHUNK_ID chunk, if the file has one
+        offset = 12
+        while offset + 8 <= len(data):
+            chunk_id, chunk_size = unpack('<4sI', offset, "chunk header")
+            body = offset + 8
+            if chunk_id == b'ds64':
+                if chunk_size < 16:
+                    raise wave.Error("ds64 chunk is too short")
+                data_size_64 = unpack('<Q', body + 8, "ds64 chunk")[0]
+            elif chunk_id == b'fmt ':
+                if chunk_size < 16:
+                    raise wave.Error("fmt chunk is too short")
+                fmt = unpack('<HHIIHH', body, "fmt chunk")
+            elif chunk_id == b'data':
+                data_offset = body
+                if data_size_64 is not None and chunk_size == 0xFFFFFFFF:
+                    chunk_size = data_size_64
+                # Streamed or oversized recordings may carry a size that runs past the end of the file
+                data_size = min(chunk_size, len(data) - body)
+            elif chunk_id == PROFILE_CHUNK_ID:
+                self.profile_data = bytes(data[body:body + chunk_size])
+            offset = body + chunk_size + (chunk_size & 1)
+        if fmt is None:
+            raise wave.Error("fmt chunk missing")
+        if data_offset is None:
+            raise wave.Error("data chunk missing")
+
+        format_tag, self._nchannels, self._framerate, _, block_align, bits = fmt
+        if format_tag not in (1, 0xFFFE) or bits != 16:
+            raise wave.Error("only 16-bit PCM is supported")
+        if self._nchannels == 0 or block_align != 2 * self._nchannels:
+            raise wave.Error("invalid channel count or block alignment")
+        self._nframes = data_size // block_align
+
+        # First channel of the data chunk, as a view straight into the mapping
+        frames = np.frombuffer(data, dtype='<i2', count=self._nframes * self._nchannels, offset=data_offset)
+        self.samples = frames.reshape(self._nframes, self._nchannels)[:, 0]
+
+    def getnchannels(self):
+        return self._nchannels
+
+    def getsampwidth(self):
+        return 2
+
+    def getframerate(self):
+        return self._framerate
+
+    def getnframes(self):
+        return self._nframes
+
+    def tell(self):
+        return self._pos
+
+    def setpos(self, pos):
+        if not 0 <= pos <= self._nframes:
+            raise wave.Error("position not in range")
+        self._pos = pos
+
+    def rewind(self):
+        self._pos = 0
+
+    # Function to return the next nframes samples as a view into the file (empty at the end of the data)
+    def readframes(self, nframes):
+        frames = self.samples[self._pos:self._pos + nframes]
+        self._pos += len(frames)
+        return frames
+
+    def close(self):
+        self.samples = None
+        if getattr(self, '_map', None) is not None:
+            try:
+                self._map.close()
+            except BufferError:
+                pass  # Views handed out earlier keep the mapping alive until they are released
+            self._map = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+# Cache of Goertzel bank coefficients, keyed by window length and tones
+_goertzel_banks = {}
+
+# Function to get the coefficient matrix of a Goertzel filter bank for the given window length, tones and sample rate
+def goertzel_bank(window_length, freqs, rate=RATE):
+    key = (window_length, tuple(freqs), rate)
+    bank = _goertzel_banks.get(key)
+    if bank is None:
+        # The Goertzel recurrence for a tone ends in |sum(x[n] * e^(-j*w*n))|, so the whole
+        # bank reduces to projecting each window onto a cosine and a sine column per tone
+        phase = np.outer(np.arange(window_length) / rate, 2 * np.pi * np.asarray(freqs, dtype=np.float64))
+        bank = np.concatenate([np.cos(phase), np.sin(phase)], axis=1)
+        _goertzel_banks[key] = bank
+    return bank
+
+# Function to compute the energy of each tone in each window (windows is a 1-D window or an (n, window_length) array)
+def tone_energies(windows, freqs, rate=RATE):
+    windows = np.atleast_2d(windows)
+    projections = windows @ goertzel_bank(windows.shape[1], freqs, rate)
+    return projections[:, :len(freqs)] ** 2 + projections[:, len(freqs):] ** 2
+
+# Function to decode the bits following the start marker using the Goertzel bank on batches of windows
+def decode_bits_goertzel(wav_file, profile=DEFAULT_PROFILE, framed=True):
+    decoded_bits = BitBuffer()
+    clock = SymbolClock(profile)
+    pos = wav_file.tell()
+    frame_bits = None  # Bits in the frame once its header is in, 0 for raw data or a damaged header
+    while True:
+        freqs, values, pos = classify_symbols_tracked(wav_file.samples, pos, GOERTZEL_BATCH, profile, 'goertzel', clock)
+        if not len(values):
+            break
+
+        # Each symbol is the data tone carrying the most energy
+        bits = symbols_to_bits(values, profile.bits_per_symbol)
+        if frame_bits is None:
+            frame_bits = frame_bit_count(np.concatenate((decoded_bits.view(), bits)), framed)
+            if frame_bits:
+                decoded_bits.reserve(frame_bits)
+
+        # A frame ends after the number of bits its header announces
+        if frame_bits:
+            decoded_bits.extend(bits[:frame_bits - len(decoded_bits)])
+            if len(decoded_bits) == frame_bits:
+                break
+            continue
+
+        # Raw data ends at the first window whose strongest tone is not a data tone, which belongs to the end marker
+        end = np.flatnonzero(end_marker_symbols(freqs, profile))
+        count = end[0] if len(end) else len(values)
+        decoded_bits.extend(bits[:count * profile.bits_per_symbol])
+        if len(end):
+            break
+    return decoded_bits
+
+# Function to classify every row of an (n_symbols, frames_per_bit) matrix in one pass
+# Returns the detected frequency of each symbol and the symbol value it decodes to
+def classify_symbols(symbols, profile=DEFAULT_PROFILE, demod='goertzel'):
+    tones = profile.tones
+    freqs = np.empty(len(symbols))
+    values = np.empty(len(symbols), dtype=np.intp)
+    for i in range(0, len(symbols), BATCHED_DECODE_ROWS):
+        chunk = symbols[i:i + BATCHED_DECODE_ROWS]
+        rows = slice(i, i + len(chunk))
+        if demod == 'goertzel':
+            # Strongest tone per symbol, and the strongest of the data tones
+            energies = tone_energies(chunk, demod_tones(profile), profile.rate)
+            freqs[rows] = np.take(demod_tones(profile), np.argmax(energies, axis=1))
+            values[rows] = np.argmax(energies[:, :len(tones)], axis=1)
+        else:
+            # Spectral peak per symbol from one real FFT along axis 1, mapped to the nearest data tone
+            spectrum = np.abs(np.fft.rfft(chunk, axis=1))
+            freqs[rows] = np.argmax(spectrum, axis=1) * (profile.rate / chunk.shape[1])
+            values[rows] = np.argmin(np.abs(freqs[rows, None] - np.asarray(tones)), axis=1)
+    return freqs, values
+
+# Function to flag the symbols, classified by classify_symbols, that belong to the end marker rather than the data
+def end_marker_symbols(freqs, profile=DEFAULT_PROFILE, demod='goertzel'):
+    if demod == 'goertzel':
+        return ~np.isin(freqs, profile.tones)
+    # Within 500 Hz of an end marker tone, and closer to it than to any data tone
+    tolerance = np.minimum(500, np.min(np.abs(freqs[:, None] - np.asarray(profile.tones)), axis=1))
+    return np.any(np.abs(freqs[:, None] - np.asarray(profile.end_marker)) < tolerance[:, None], axis=1)
+
+# Symbol clock recovery: the sender's and the receiver's sample clocks differ by tens of ppm, so over a long
+# transmission the symbols slide away from the windows a fixed symbol length puts them in
+# Every boundary between two symbols of different tones is an early-late gate: in a window centred on where the
+# boundary should be, the earlier symbol's tone outweighs the later one's by as much as the boundary really comes
+# later. After every TIMING_BLOCK symbols, a proportional-integral loop turns the mean error into a shift of the
+# next windows, and follows the drift so that a steady clock offset leaves no lasting error
+# A profile tuned to a faster or slower sender (CodecProfile.scaled) starts the drift at the offset its scale implies
+class SymbolClock:
+    __slots__ = ('window_length', 'last', 'remaining', 'drift', '_initial_drift', '_residual', '_error_sum',
+                 '_transitions')
+
+    def __init__(self, profile=DEFAULT_PROFILE):
+        self.window_length = profile.frames_per_symbol
+        # A sender whose frequencies come out scale times too high sends symbols scale times too short (OFDM symbols
+        # have their cyclic prefix in front)
+        period = self.window_length + (ofdm_prefix(profile) if profile.modulation == 'ofdm' else 0)
+        self._initial_drift = TIMING_BLOCK * period * (1 / profile.scale - 1)
+        self.reset()
+
+    # Function to start over at the first symbol of a transmission
+    def reset(self):
+        self.last = -1  # Value of the last symbol demodulated, -1 before the first
+        self.remaining = TIMING_BLOCK  # Symbols until the next correction
+        self.drift = self._initial_drift  # Samples per block the symbols are followed by on top of the measured errors
+        self._residual = 0.0  # Fraction of a sample corrected but not yet applied
+        self._error_sum = 0.0
+        self._transitions = 0
+
+    # Function to add the timing errors of boundaries, given the energies of the earlier and the later symbol's tone in
+    # the windows centred on them (scalars for one boundary, arrays for several)
+    def measure(self, earlier, later):
+        # Both energies grow with the square of the part of the window their symbol covers
+        self.add_errors((earlier - later) / (earlier + later + 1e-12) * (self.window_length / 4))
+
+    # Function to add timing errors in samples, positive where the windows are early (a scalar or an array)
+    def add_errors(self, errors):
+        self._error_sum += float(np.sum(errors))
+        self._transitions += np.size(errors)
+
+    # Function to count symbols demodulated; returns the whole samples to move the next window by (0 inside a block)
+    def advance(self, count):
+        self.remaining -= count
+        if self.remaining > 0:
+            return 0
+        self.remaining = TIMING_BLOCK
+        error = self._error_sum / self._transitions if self._transitions else 0.0
+        self._error_sum = 0.0
+        self._transitions = 0
+        self.drift += TIMING_DRIFT_GAIN * error
+        self._residual += TIMING_GAIN * error + self.drift
+        shift = int(round(self._residual))
+        self._residual -= shift
+        return shift
+
+# Function to classify up to count symbols of samples starting at sample pos, in blocks whose windows the symbol
+# clock re-centres; returns the detected frequency and the value of each symbol (as classify_symbols), and the
+# position of the next symbol (fewer symbols are returned where the samples run out)
+def classify_symbols_tracked(samples, pos, count, profile, demod, clock):
+    length = profile.frames_per_symbol
+    freqs = np.empty(count)
+    values = np.empty(count, dtype=np.intp)
+    done = 0
+    while done < count:
+        n = min(count - done, clock.remaining, (len(samples) - pos) // length)
+        if n <= 0:
+            break
+        block = slice(done, done + n)
+        rows = samples[pos:pos + n * length].reshape(n, length)
+        freqs[block], values[block] = classify_symbols(rows, profile, demod)
+
+        # Boundaries in front of the symbols whose tone differs from the one before, including the last symbol of the
+        # previous block when the samples before pos are still there
+        previous = np.concatenate(([clock.last], values[done:done + n - 1]))
+        changed = np.flatnonzero((previous != values[block]) & (previous >= 0))
+        changed = changed[pos - length // 2 + changed * length >= 0]
+        if len(changed):
+            windows = samples[(pos - length // 2 + changed * length)[:, None] + np.arange(length)]
+            energies = tone_energies(windows, profile.tones, profile.rate)
+            boundaries = np.arange(len(changed))
+            clock.measure(energies[boundaries, previous[changed]], energies[boundaries, values[done + changed]])
+        clock.last = values[done + n - 1]
+        done += n
+        pos += n * length + clock.advance(n)
+    return freqs[:done], values[:done], pos
+
+# Function to get the codec profile of an open MappedWav: the one the encoder stored in it or, for files without one
+# (older files and recordings), the fallback profile if one is given and else the default profile of the given mode at
+# the file's own sample rate
+def read_codec_profile(wav_file, mfsk=2, modulation='fsk', fallback=None):
+    if wav_file.profile_data is None:
+        if fallback is None:
+            return CodecProfile(modulation, mfsk, rate=wav_file.getframerate())
+        profile = fallback
+    else:
+        profile = CodecProfile.from_json(wav_file.profile_data)
+    if profile.rate != wav_file.getframerate():
+        raise wave.Error("codec profile sample rate does not match the file")
+    return profile
+
+# Function to measure how far the received tones are off, from the start marker beginning at sample start
+# Each marker tone's peak is found within FREQUENCY_OFFSET_LIMIT of its nominal frequency in a Hann-windowed,
+# zero-padded FFT and placed between bins by a parabola through the log magnitudes around it; returns the median ratio
+# of the measured to the nominal frequencies (1.0 if the marker is not all there)
+def estimate_frequency_scale(samples, start, profile=DEFAULT_PROFILE):
+    length = profile.frames_per_marker_tone
+    nominal = np.asarray(profile.start_marker, dtype=np.float64)
+    if start < 0 or start + len(nominal) * length > len(samples):
+        return 1.0
+    tones = samples[start:start + len(nominal) * length].reshape(len(nominal), length)
+    fft_size = max(FREQUENCY_ESTIMATE_FFT_SIZE, 1 << (length - 1).bit_length())
+    spectrum = np.abs(np.fft.rfft(tones * np.hanning(length), fft_size, axis=1)) + 1e-12
+    bin_width = profile.rate / fft_size
+
+    # Strongest bin of each tone's own search range
+    low = np.floor(nominal * (1 - FREQUENCY_OFFSET_LIMIT) / bin_width).astype(np.intp)
+    high = np.ceil(nominal * (1 + FREQUENCY_OFFSET_LIMIT) / bin_width).astype(np.intp)
+    search = np.clip(low[:, None] + np.arange(np.max(high - low) + 1), 1, spectrum.shape[1] - 2)
+    rows = np.arange(len(nominal))
+    peaks = search[rows, np.argmax(spectrum[rows[:, None], search], axis=1)]
+
+    below, at, above = (np.log(spectrum[rows, peaks + i]) for i in (-1, 0, 1))
+    curvature = below - 2 * at + above
+    fraction = np.where(curvature < 0, 0.5 * (below - above) / np.where(curvature < 0, curvature, -1), 0.0)
+    return float(np.median((peaks + fraction) * bin_width / nominal))
+
+# Function to get the profile to demodulate a transmission with, tuned to the tones of its start marker at sample start
+# (OFDM subcarriers are read from the whole FFT bins their tuned tones round to, so for OFDM only the symbol clock
+# follows the scale)
+def tune_profile(samples, start, profile):
+    return profile.scaled(estimate_frequency_scale(samples, start, profile))
+
+# Function to get the sample offset of the first data symbol after sample offset, or None if the start marker is missing
+def find_data_start(wav_file, profile, offset=0):
+    start = search_marker(wav_file.samples, profile.start_marker, offset, profile)
+    if start is None:
+        return None
+    return start + len(profile.start_marker) * profile.frames_per_marker_tone
+
+# Function to decode a whole WAV file by demodulating its samples as (n_symbols, frames_per_bit) matrices of many
+# symbols
+# The codec profile comes from the file, or from mfsk for files without one, unless it is passed in
+# The start marker is searched for from sample offset, so later transmissions in a recording can be decoded too
+def decode_audio_from_file_batched(filename, demod='goertzel', mfsk=2, profile=None, offset=0, framed=True):
+    with MappedWav(filename) as wav_file:
+        if profile is None:
+            profile = read_codec_profile(wav_file, mfsk)
+        start = find_data_start(wav_file, profile, offset)
+        if start is None:
+            return b''
+
+        # Symbols are demodulated straight from the mapped samples, at the tones the start marker came in at and in
+        # blocks that follow the sender's clock
+        samples = wav_file.samples
+        profile = tune_profile(samples, start - len(profile.start_marker) * profile.frames_per_marker_tone, profile)
+        clock = SymbolClock(profile)
+
+        # A frame header says how many symbols follow, so only those are demodulated
+        bits_per_symbol = profile.bits_per_symbol
+        header_symbols = -(-FRAME_HEADER_BITS // bits_per_symbol)
+        freqs, values, pos = classify_symbols_tracked(samples, start, header_symbols, profile, demod, clock)
+        frame_bits = frame_bit_count(symbols_to_bits(values, bits_per_symbol), framed)
+        if frame_bits:
+            frame_symbols = -(-frame_bits // bits_per_symbol)
+            if frame_symbols > len(values):
+                more_freqs, more_values, pos = classify_symbols_tracked(
+                    samples, pos, frame_symbols - len(values), profile, demod, clock)
+                values = np.concatenate((values, more_values))
+            values = values[:frame_symbols]
+        else:
+            # Raw data goes on until a symbol looks like the end marker
+            freqs, values = [freqs], [values]
+            while len(values[-1]) and not end_marker_symbols(freqs[-1], profile, demod).any():
+                more_freqs, more_values, pos = classify_symbols_tracked(
+                    samples, pos, BATCHED_DECODE_ROWS, profile, demod, clock)
+                freqs.append(more_freqs)
+                values.append(more_values)
+            freqs, values = np.concatenate(freqs), np.concatenate(values)
+        del samples
+
+    data_end = len(values)
+    if not frame_bits:
+        # Raw data ends at the first symbol that looks like the end marker
+        end = np.flatnonzero(end_marker_symbols(freqs, profile, demod))
+        data_end = end[0] if len(end) else len(values)
+
+    return unframe(bits_to_bytes(symbols_to_bits(values[:data_end], bits_per_symbol)), framed)
+
+# Function to decode an OFDM-modulated WAV file: one forward FFT per symbol, every subcarrier bin read out
+def decode_ofdm_from_file(filename, profile=None, offset=0, framed=True):
+    with MappedWav(filename) as wav_file:
+        if profile is None:
+            profile = read_codec_profile(wav_file, modulation='ofdm')
+        bits_per_symbol = profile.bits_per_symbol
+
+        start = find_data_start(wav_file, profile, offset)
+        if start is None:
+            return b''
+
+        # One OFDM symbol after another, starting with the reference symbol, each read without its cyclic prefix and
+        # in blocks that follow the sender's clock
+        samples = wav_file.samples
+        profile = tune_profile(samples, start - len(profile.start_marker) * profile.frames_per_marker_tone, profile)
+        demodulator = OfdmDemodulator(profile)
+        clock = SymbolClock(profile)
+
+        # A frame header says how many symbols follow, so only those are demodulated
+        header_symbols = -(-FRAME_HEADER_BITS // bits_per_symbol)
+        carriers, end_energy, _, pos = demodulator.track(samples, start, 1 + header_symbols, clock)
+        if len(carriers) < 2:
+            return unframe(b'', framed)
+        frame_bits = frame_bit_count(ofdm_turned(carriers).ravel(), framed)
+        if frame_bits:
+            frame_symbols = 1 + -(-frame_bits // bits_per_symbol)
+            if frame_symbols > len(carriers):
+                more_carriers, _, _, pos = demodulator.track(samples, pos, frame_symbols - len(carriers), clock)
+                carriers = np.concatenate((carriers, more_carriers))
+            carriers = carriers[:frame_symbols]
+        else:
+            # Raw data goes on until a symbol looks like the end marker
+            carriers, end_energy = [carriers], [end_energy]
+            while len(carriers[-1]) and not demodulator.is_end(carriers[-1], end_energy[-1]).any():
+                more_carriers, more_energy, _, pos = demodulator.track(samples, pos, BATCHED_DECODE_ROWS, clock)
+                carriers.append(more_carriers)
+                end_energy.append(more_energy)
+            carriers, end_energy = np.concatenate(carriers), np.concatenate(end_energy)
+        del samples
+
+    if frame_bits:
+        return unframe(bits_to_bytes(ofdm_turned(carriers).ravel()[:frame_bits]))
+
+    # Raw data ends at the first symbol that looks like the end marker
+    end = np.flatnonzero(demodulator.is_end(carriers, end_energy))
+    data_end = end[0] if len(end) else len(carriers)
+    if data_end < 2:
+        return unframe(b'', framed)
+    turned = ofdm_turned(carriers[:data_end])
+    active = demodulator.active(carriers[:data_end])
+    return unframe(bits_to_bytes(np.concatenate((turned[:-1].ravel(), turned[-1][active]))), framed)
+
+# Function to get the OFDM bits from consecutive rows of subcarriers, one row of bits per symbol after the first
+# A subcarrier whose phase turned around since the previous symbol carries a '1'
+def ofdm_turned(carriers):
+    return np.real(carriers[1:] * np.conj(carriers[:-1])) < 0
+
+# Demodulator for the multicarrier mode, shared by the file and the streaming decoders: reads every subcarrier bin of
+# rows of OFDM symbols, with one forward FFT per BATCHED_DECODE_ROWS symbols
+class OfdmDemodulator:
+    __slots__ = ('skip', '_window', '_frames', '_bins', '_end_bin', '_mixer', '_reference', '_shift', '_drifted')
+
+    def __init__(self, profile):
+        self.skip = ofdm_prefix(profile)  # Samples of cyclic prefix in front of each symbol
+        # Each window starts halfway into the cyclic prefix, so it can drift by half the prefix either way between
+        # corrections of the symbol clock without taking in the next or the previous symbol
+        self._window = self.skip - self.skip // 2
+        self._frames = frames = profile.frames_per_symbol
+        self._bins = ofdm_bins(profile)
+        # First end marker tone, which lies outside the subcarriers
+        self._end_bin = round(profile.end_marker[0] * frames / profile.rate)
+        # The tones of a tuned profile are off their bins by a fraction of a bin, and so spill into the neighbouring
+        # subcarriers; the symbols are mixed down by the subcarriers' mean offset first (the rest is far smaller)
+        offset = np.mean(profile.tones) - np.mean(self._bins) * profile.rate / frames
+        self._mixer = None if profile.scale == 1 else np.exp(-2j * np.pi * offset * np.arange(frames) / profile.rate)
+        self._reference = None  # Subcarriers of the first symbol tracked, which later symbols are timed against
+        self._shift = 0  # Samples the symbol clock has moved the windows by since then
+        self._drifted = 0.0  # Samples the symbols are expected to have moved by since then, as the clock drifts
+
+    # Function to demodulate up to count symbols starting at sample pos (at its cyclic prefix), in blocks whose windows
+    # the symbol clock re-centres; one demodulator tracks one transmission
+    # A window s samples late turns subcarrier bin k by 2 * pi * k * s / frames: squaring each subcarrier's turn since
+    # the first symbol takes its data (a DBPSK sign) out, and the slope of that across the subcarriers tells how far
+    # the windows have moved against the symbols since then; the turns the clock's own shifts cause are taken back out,
+    # and so are those of the symbols drifting against the windows in between (at the clock's drift, spread evenly
+    # over each block), so consecutive symbols can still be compared
+    # Returns the subcarriers and end marker bin energies (as carriers), the position of each symbol and the position
+    # of the next one (fewer symbols are returned where the samples run out)
+    def track(self, samples, pos, count, clock):
+        length = self.skip + self._frames
+        carriers = np.empty((count, len(self._bins)), dtype=np.complex128)
+        end_energy = np.empty(count)
+        starts = np.empty(count, dtype=np.intp)
+        spacing = self._bins[1] - self._bins[0] if len(self._bins) > 1 else 1
+        done = 0
+        while done < count:
+            n = min(count - done, clock.remaining, (len(samples) - pos) // length)
+            if n <= 0:
+                break
+            block = slice(done, done + n)
+            starts[block] = pos + length * np.arange(n)
+            bodies = samples[pos:pos + n * length].reshape(n, length)[:, self._window:self._window + self._frames]
+            block_carriers, end_energy[block] = self.carriers(bodies)
+            if self._reference is None:
+                self._reference = block_carriers[0]
+            turned = (block_carriers * np.conj(self._reference)) ** 2
+            slope = np.angle(np.sum(turned[:, 1:] * np.conj(turned[:, :-1]), axis=1))
+            clock.add_errors(-slope * self._frames / (4 * np.pi * spacing))
+            drifted = self._drifted + clock.drift / TIMING_BLOCK * np.arange(n)
+            moved = self._shift - drifted[:, None]
+            carriers[block] = block_carriers * np.exp(-2j * np.pi * self._bins * moved / self._frames)
+            self._drifted += clock.drift / TIMING_BLOCK * n
+            done += n
+            shift = clock.advance(n)
+            self._shift += shift
+            pos += n * length + shift
+        return carriers[:done], end_energy[:done], starts[:done], pos
+
+    # Function to get the subcarriers of rows of symbol windows and the energy in the end marker bin of each
+    def carriers(self, bodies):
+        carriers = np.empty((len(bodies), len(self._bins)), dtype=np.complex128)
+        end_energy = np.empty(len(bodies))
+        for i in range(0, len(bodies), BATCHED_DECODE_ROWS):
+            if self._mixer is None:
+                spectrum = np.fft.rfft(bodies[i:i + BATCHED_DECODE_ROWS], axis=1)
+            else:
+                spectrum = np.fft.fft(bodies[i:i + BATCHED_DECODE_ROWS] * self._mixer, axis=1)
+            carriers[i:i + len(spectrum)] = spectrum[:, self._bins]
+            end_energy[i:i + len(spectrum)] = np.abs(spectrum[:, self._end_bin]) ** 2
+        return carriers, end_energy
+
+    # Function to tell which symbols look like the end marker: its tone outweighs the subcarriers
+    def is_end(self, carriers, end_energy):
+        return end_energy > np.mean(np.abs(carriers) ** 2, axis=1)
+
+    # Function to tell which subcarriers of the last of at least two symbols carry data: ones left silent do not
+    def active(self, carriers):
+        return np.abs(carriers[-1]) > 0.5 * np.abs(carriers[-2])
+
+# Demodulator for the differential PSK modes, shared by the file and the streaming decoders: mixes rows of symbols
+# down with a local carrier at the profile's tone and reads the phase steps between them
+class DpskDemodulator:
+    __slots__ = ('skip', 'bits_per_symbol', '_frames', '_gate', '_order', '_step_values', '_carrier', '_mixer',
+                 '_phase')
+
+    def __init__(self, profile):
+        self._frames = frames = profile.frames_per_symbol
+        self.skip = round(DPSK_RAMP * frames)  # Samples of phase ramp at the front of each symbol, which are not read
+        self._gate = self.skip // 2  # Samples the timing windows are moved early and late by
+        self.bits_per_symbol = profile.bits_per_symbol
+        steps = dpsk_phase_steps(self.bits_per_symbol)
+        self._order = len(steps)
+        # Symbol value sent by each phase step, in units of 2 * pi / order
+        self._step_values = np.argsort(np.rint(steps / (2 * np.pi / self._order)).astype(np.intp) % self._order)
+        self._carrier = profile.tones[0] / profile.rate  # Carrier cycles per sample
+        self._mixer = np.exp(-2j * np.pi * self._carrier * np.arange(self.skip, frames))
+        self._phase = 0.0  # Cycles the local carrier has run through by the next symbol; one demodulator tracks one
+        # transmission
+
+    # Function to mix down up to count symbols starting at sample pos, in blocks whose windows the symbol clock
+    # re-centres; each symbol is mixed with one local carrier running on from call to call (the next call carrying on
+    # from the position returned), so its phase does not depend on where its window is
+    # Where the phase steps, the window of the symbol before moved late by the gate takes in the start of the step's
+    # ramp, and the window of the symbol after moved early takes in its end: windows on time lose as much of the
+    # carrier in both, late windows lose more in the first
+    # Returns the mixed-down symbols, the position of each and the position of the next symbol (fewer symbols are
+    # returned where the samples run out)
+    def track(self, samples, pos, count, clock):
+        frames = self._frames
+        baseband = np.empty(count, dtype=np.complex128)
+        starts = np.empty(count, dtype=np.intp)
+        origin = pos
+        done = 0
+        while done < count:
+            n = min(count - done, clock.remaining, (len(samples) - pos) // frames)
+            if n <= 0:
+                break
+            block = slice(done, done + n)
+            starts[block] = pos + frames * np.arange(n)
+            phases = (self._phase + self._carrier * (starts[block] - origin)) % 1
+            baseband[block] = self._mix(samples, pos, n) * np.exp(-2j * np.pi * phases)
+            if n > 1:
+                late = np.abs(self._mix(samples, pos + self._gate, n - 1)) ** 2
+                early = np.abs(self._mix(samples, pos + frames - self._gate, n - 1)) ** 2
+                stepped = self._nearest(baseband[block]) != 0
+                clock.measure(late[stepped], early[stepped])
+            done += n
+            pos += n * frames + clock.advance(n)
+        self._phase = (self._phase + self._carrier * (pos - origin)) % 1
+        return baseband[:done], starts[:done], pos
+
+    # Function to mix down n consecutive symbols starting at sample pos with the carrier running from there
+    def _mix(self, samples, pos, n):
+        return samples[pos:pos + n * self._frames].reshape(n, self._frames)[:, self.skip:] @ self._mixer
+
+    # Function to get the phase step between consecutive mixed-down symbols, rounded to the nearest step, in units of
+    # 2 * pi / order
+    def _nearest(self, baseband):
+        turns = baseband[1:] * np.conj(baseband[:-1])
+        return np.rint(np.angle(turns) / (2 * np.pi / self._order)).astype(np.intp) % self._order
+
+    # Function to get the bits sent by the phase steps between consecutive mixed-down symbols
+    def bits(self, baseband):
+        return symbols_to_bits(self._step_values[self._nearest(baseband)], self.bits_per_symbol)
+
+    # Function to tell which symbols look like the end marker: the carrier fades below half the level of the
+    # reference symbol where the marker moves off its frequency
+    def is_end(self, baseband, level):
+        return np.abs(baseband) < 0.5 * level
+
+# Function to decode a DBPSK or DQPSK WAV file by mixing it down with a continuous local carrier
+# modulation ('dbpsk' or 'dqpsk') is only used for files without a codec profile
+def decode_dpsk_from_file(filename, modulation='dbpsk', profile=None, offset=0, framed=True):
+    with MappedWav(filename) as wav_file:
+        if profile is None:
+            profile = read_codec_profile(wav_file, modulation=modulation)
+        start = find_data_start(wav_file, profile, offset)
+        if start is None:
+            return b''
+
+        # The carrier is mixed down at the frequency the start marker came in at
+        profile = tune_profile(wav_file.samples, start - len(profile.start_marker) * profile.frames_per_marker_tone,
+                               profile)
+        bits_per_symbol = profile.bits_per_symbol
+        demodulator = DpskDemodulator(profile)
+
+        # One symbol after another, starting with the reference symbol, each read without its phase ramp
+        samples = wav_file.samples
+        clock = SymbolClock(profile)
+
+        # A frame header says how many symbols follow, so only those are demodulated
+        header_symbols = -(-FRAME_HEADER_BITS // bits_per_symbol)
+        baseband, _, pos = demodulator.track(samples, start, 1 + header_symbols, clock)
+        if len(baseband) < 2:
+            return unframe(b'', framed)
+        level = np.abs(baseband[0])
+        frame_bits = frame_bit_count(demodulator.bits(baseband), framed)
+        if frame_bits:
+            frame_symbols = 1 + -(-frame_bits // bits_per_symbol)
+            if frame_symbols > len(baseband):
+                more_baseband, _, pos = demodulator.track(samples, pos, frame_symbols - len(baseband), clock)
+                baseband = np.concatenate((baseband, more_baseband))
+            baseband = baseband[:frame_symbols]
+        else:
+            # Raw data goes on until a symbol looks like the end marker
+            baseband = [baseband]
+            while len(baseband[-1]) and not demodulator.is_end(baseband[-1], level).any():
+                more_baseband, _, pos = demodulator.track(samples, pos, BATCHED_DECODE_ROWS, clock)
+                baseband.append(more_baseband)
+            baseband = np.concatenate(baseband)
+        del samples
+
+    if frame_bits:
+        return unframe(bits_to_bytes(demodulator.bits(baseband)[:frame_bits]))
+
+    # Raw data ends at the first symbol that looks like the end marker
+    end = np.flatnonzero(demodulator.is_end(baseband, level))
+    data_end = end[0] if len(end) else len(baseband)
+    return unframe(bits_to_bytes(demodulator.bits(baseband[:data_end])), framed)
+
+# Correlator of a marker sequence with stretches of samples: each tone of the marker is correlated with the samples it
+# would cover, and the magnitudes of those correlations are added up, normalized by the energy under the whole marker
+# so the result does not depend on signal level (a clean marker scores 1). Adding magnitudes rather than the
+# correlations themselves keeps the score where a sender's clock offset turns the tones' phases against each other
+# over the length of the marker
+# Each tone's correlation at every lag comes from running sums of the samples mixed down by it (its cosine and sine
+# parts, kept apart so no step casts between types); the mixers and every work buffer are set up once for block lags,
+# so a receiver that keeps one correlator for all the chunks it searches allocates no arrays per search
+class MarkerCorrelator:
+    __slots__ = ('length', 'block', '_tone_length', '_tones', '_norm', '_segment', '_mixers', '_sums', '_difference',
+                 '_magnitudes', '_energy', '_norms', '_scores')
+
+    def __init__(self, marker_freqs, profile=DEFAULT_PROFILE, block=None):
+        self._tone_length = tone_length = profile.frames_per_marker_tone
+        self.length = length = len(marker_freqs) * tone_length
+        self.block = block = 4 * length if block is None else block  # Most lags scored by one call
+        freqs = sorted(set(marker_freqs))
+        self._tones = [freqs.index(freq) for freq in marker_freqs]  # Which of the distinct frequencies each tone is
+        # A clean marker correlates with each of its tones by half the tone length times its amplitude
+        self._norm = np.sqrt(length / 2)
+        n = block + length - 1
+        self._segment = np.empty(n)
+        phases = 2 * np.pi * np.outer(freqs, np.arange(n)) / profile.rate
+        self._mixers = np.stack((np.cos(phases), np.sin(phases)), axis=1)
+        self._sums = np.zeros((len(freqs), 2, n + 1))  # Running sums, each starting at 0
+        self._difference = np.empty((2, n - tone_length + 1))
+        self._magnitudes = np.empty((len(freqs), n - tone_length + 1))
+        self._energy = np.zeros(n + 1)  # Running sum of squares of the segment, starting at 0
+        self._norms = np.empty(block)
+        self._scores = np.empty(block)
+
+    # Function to get the normalized correlation at up to count lags from sample pos (at most block of them, and only
+    # those with a whole marker length of samples), in a buffer reused by the next call
+    def scores(self, samples, pos, count):
+        length, tone_length = self.length, self._tone_length
+        n = max(min(len(samples) - pos, min(count, self.block) + length - 1), 0)
+        segment = self._segment[:n]
+        segment[:] = samples[pos:pos + n]
+        lags = max(n - length + 1, 0)
+        spans = max(n - tone_length + 1, 0)  # Lags at which one tone has its samples
+
+        # Magnitude of the correlation with each distinct frequency over one tone length, at every lag
+        difference = self._difference[:, :spans]
+        for mixer, sums, magnitudes in zip(self._mixers, self._sums, self._magnitudes):
+            running = sums[:, 1:n + 1]
+            np.multiply(segment, mixer[:, :n], out=running)
+            np.cumsum(running, axis=1, out=running)
+            np.subtract(sums[:, tone_length:n + 1], sums[:, :spans], out=difference)
+            np.square(difference, out=difference)
+            np.add(difference[0], difference[1], out=magnitudes[:spans])
+            np.sqrt(magnitudes[:spans], out=magnitudes[:spans])
+        scores = self._scores[:lags]
+        scores[:] = 0.0
+        for i, tone in enumerate(self._tones):
+            scores += self._magnitudes[tone, i * tone_length:i * tone_length + lags]
+
+        # Energy of the samples under the marker at every lag, from a running sum of squares
+        energy = self._energy[1:n + 1]
+        energy[:] = segment
+        np.square(energy, out=energy)
+        np.cumsum(energy, out=energy)
+        norms = self._norms[:lags]
+        np.subtract(self._energy[length:length + lags], self._energy[:lags], out=norms)
+        np.maximum(norms, 1.0, out=norms)
+        np.sqrt(norms, out=norms)
+        norms *= self._norm
+        np.divide(scores, norms, out=scores)
+        return scores
+
+# Function to find the sample offset at which a marker sequence starts, searching from sample start
+# The input is correlated with the marker tone by tone over large blocks of lags; a correlator set up for the marker
+# can be passed in to be reused, and otherwise one is set up for the input
+# The score peaks where every tone lines up and falls off linearly on either side, so the offset is accurate to within
+# a few samples even with the sender's clock 2000 ppm off, which the symbol windows and the symbol clock absorb. The
+# start marker repeats its first half, which half a marker early or late still matches half its tones; that scores at
+# most about 0.7, and the first crossing of the threshold is at most that far ahead of the marker, so the marker is
+# the best score within one marker length of it
+# Returns None if no offset reaches ACQUISITION_THRESHOLD
+def acquire_marker(samples, marker_freqs, start=0, threshold=ACQUISITION_THRESHOLD, profile=DEFAULT_PROFILE,
+                   correlator=None):
+    if correlator is None:
+        length = len(marker_freqs) * profile.frames_per_marker_tone
+        # Short inputs (such as real-time buffers) get correspondingly short buffers
+        correlator = MarkerCorrelator(marker_freqs, profile, min(max(len(samples) - start, length), ACQUISITION_BLOCK))
+    length = correlator.length
+    block = correlator.block  # Correlation lags produced per call
+
+    pos = start
+    while pos + length <= len(samples):
+        score = correlator.scores(samples, pos, block)
+        lags = len(score)
+        if score.max() >= threshold:
+            first = int(np.flatnonzero(score >= threshold)[0])
+            # The peak lies within one marker length of the first crossing; if that span
+            # runs past this block, correlate again from the crossing so the result is the same
+            if first + length <= lags or pos + lags + length - 1 >= len(samples):
+                return pos + first + int(np.argmax(score[first:first + length]))
+            if first > 0:
+                pos += first
+                continue
+        pos += block
+    return None
+
+# Function to get the sample ranges within samples[start:stop] in which a marker may begin, with a pre-scan far cheaper
+# than acquiring one: recordings are mostly silence and room noise, which leave the 15-20 kHz band of the tones quiet
+# Probe windows are spaced so that every marker holds one whole; each is transformed in vectorized batches for its RMS
+# and the energy in the FFT bins around each of the profile's tones, of which a transmission sends one at a time (so
+# the strongest tone measures it without the noise in the rest of the band). A probe may hold a transmission where it
+# is not silent and its strongest tone stands above the noise floor of the range, or holds several times its share of
+# the probe's energy (as when a transmission fills the whole range and so sets the floor)
+# Returns sorted, disjoint (begin, end) ranges, each covering every offset at which a marker holding an active probe
+# could begin
+def find_active_regions(samples, profile, start=0, stop=None):
+    stop = len(samples) if stop is None else min(stop, len(samples))
+    length = len(profile.start_marker) * profile.frames_per_marker_tone
+    window = max(min(PRESCAN_WINDOW, length // 2), 1)
+    stride = length - window
+
+    # Probes reach a marker length past both ends, so markers crossing them are seen
+    first = max(start - length, 0)
+    probes = np.arange(first, max(min(stop + length, len(samples)) - window + 1, first), stride)
+    if not len(probes):
+        return []
+    freqs = np.fft.rfftfreq(window, 1 / profile.rate)
+    # One column per tone, selecting the bins around it
+    tone_bins = (np.abs(freqs[:, None] - np.asarray(demod_tones(profile))) <=
+                 PRESCAN_TONE_BINS * profile.rate / window).astype(np.float64)
+    taper = np.hanning(window)
+    tone_energy = np.empty(len(probes))
+    density = np.empty(len(probes))
+    for i in range(0, len(probes), PRESCAN_BATCH):
+        batch = slice(i, i + PRESCAN_BATCH)
+        windows = samples[probes[batch, None] + np.arange(window)].astype(np.float64)
+        power = np.abs(np.fft.rfft(windows * taper, axis=1)) ** 2
+        energies = power @ tone_bins
+        tone_energy[batch] = energies.max(axis=1)
+        density[batch] = np.max(energies / tone_bins.mean(axis=0), axis=1) / np.maximum(power.sum(axis=1), 1e-12)
+
+    floor = np.percentile(tone_energy, PRESCAN_FLOOR_PERCENTILE)
+    active = (tone_energy > PRESCAN_FLOOR_RATIO * floor) | (density > PRESCAN_TONE_DENSITY)
+
+    # A marker holding the probe at p begins within a marker length before it; a stride of slack on either side
+    # keeps markers that only just hold a probe
+    regions = []
+    for probe in probes[active]:
+        begin = max(int(probe) - length - stride, start)
+        end = min(int(probe) + stride + 1, stop)
+        if begin >= end:
+            continue
+        if regions and begin <= regions[-1][1]:
+            regions[-1] = (regions[-1][0], end)
+        else:
+            regions.append((begin, end))
+    return regions
+
+# Function to find the sample offset at which a marker sequence starts, searching from sample start, with the
+# pre-scan of find_active_regions gating acquisition; the recording is scanned SHARD_SECONDS at a time, so a marker
+# near the start is found without scanning the rest. Returns None if there is none
+def search_marker(samples, marker_freqs, start=0, profile=DEFAULT_PROFILE):
+    length = len(marker_freqs) * profile.frames_per_marker_tone
+    shard = SHARD_SECONDS * profile.rate
+    correlator = None
+    for shard_start in range(start, len(samples), shard):
+        for begin, end in find_active_regions(samples, profile, shard_start, shard_start + shard):
+            if correlator is None:
+                correlator = MarkerCorrelator(marker_freqs, profile, min(len(samples) - begin, ACQUISITION_BLOCK))
+            # The search can run a marker length past the region, so a marker beginning in it is found whole
+            offset = acquire_marker(samples[:end + 2 * length], marker_freqs, begin, profile=profile,
+                                    correlator=correlator)
+            if offset is not None:
+                return offset
+    return None
+
+# Function to detect and skip the entire marker sequence (start or end) from a file-based WAV
+# The reader is left on the first frame after the marker, or at the end of the file if there is none
+def skip_marker_file_based(wav_file, marker_freqs, profile=DEFAULT_PROFILE):
+    offset = search_marker(wav_file.samples, marker_freqs, wav_file.tell(), profile)
+    if offset is None:
+        wav_file.setpos(wav_file.getnframes())
+    else:
+        wav_file.setpos(offset + len(marker_freqs) * profile.frames_per_marker_tone)
+
+# Single-producer/single-consumer ring buffer of int16 samples: the bounded queue between the capture and DSP threads
+# The producer only advances the write counter and the consumer only advances the read counter, so neither takes a lock
+class SampleRingBuffer:
+    def __init__(self, capacity):
+        self._buffer = np.zeros(capacity, dtype=np.int16)
+        self._written = 0  # Total samples written, owned by the producer
+        self._read = 0  # Total samples consumed, owned by the consumer
+        self._ready = threading.Event()
+
+    def capacity(self):
+        return len(self._buffer)
+
+    def available(self):
+        return self._written - self._read
+
+    # Function to get the total number of samples consumed so far
+    def consumed(self):
+        return self._read
+
+    # Function to append samples (producer side); returns False and drops the whole buffer if it does not fit
+    def write(self, samples):
+        capacity = len(self._buffer)
+        if len(samples) > capacity - (self._written - self._read):
+            return False
+        start = self._written % capacity
+        first = min(len(samples), capacity - start)
+        self._buffer[start:start + first] = samples[:first]
+        self._buffer[:len(samples) - first] = samples[first:]
+        self._written += len(samples)
+        self._ready.set()
+        return True
+
+    # Function to block until at least count samples are available (consumer side)
+    def wait(self, count, timeout=0.1):
+        while self._written - self._read < count:
+            self._ready.clear()
+            if self._written - self._read >= count:
+                break
+            self._ready.wait(timeout)
+
+    # Function to get how many of the unread samples lie before the end of the buffer, where they wrap around
+    def contiguous(self):
+        return min(self._written - self._read, len(self._buffer) - self._read % len(self._buffer))
+
+    # Function to look at the next count unread samples without consuming them
+    # Returns a view into the buffer unless the samples wrap around its end
+    def peek(self, count):
+        capacity = len(self._buffer)
+        start = self._read % capacity
+        if start + count <= capacity:
+            return self._buffer[start:start + count]
+        return np.concatenate((self._buffer[start:], self._buffer[:start + count - capacity]))
+
+    # Function to consume count samples
+    def advance(self, count):
+        self._read += count
+
+# Counters shared by the capture callback, the DSP worker and the thread reporting on them
+# Each counter has a single writer, so plain attributes are enough
+class ReceiverStats:
+    def __init__(self):
+        self.captured_buffers = 0  # Buffers delivered by the capture callback
+        self.dropped_buffers = 0  # Buffers lost because the queue was full
+        self.input_overflows = 0  # Buffers PortAudio flagged as having lost input before they reached us
+        self.max_queue_depth = 0  # Largest number of samples waiting for the DSP worker
+        self.dsp_seconds = 0.0  # Time the DSP worker spent processing
+
+    # Function to describe the receiver state for the given queue, which holds audio at the given sample rate
+    def summary(self, ring, rate=RATE):
+        audio_seconds = ring.consumed() / rate
+        load = 100 * self.dsp_seconds / audio_seconds if audio_seconds else 0.0
+        return (f"queue {ring.available() / rate:.2f} s "
+                f"(max {self.max_queue_depth / rate:.2f} s of {ring.capacity() / rate:.1f} s), "
+                f"{self.captured_buffers} buffers captured, {self.dropped_buffers} dropped, "
+                f"{self.input_overflows} input overflows, DSP load {load:.1f}%")
+
+# Per-window demodulator for long-running receivers: what does not depend on the samples (the frequency of every
+# spectrum bin and the decision a spectral peak in it leads to, or the Goertzel bank) is worked out once, and every
+# window is demodulated into the same preallocated buffers, so the steady state allocates no arrays
+# demod is 'fft' (spectral peak, nearest data tone) or 'goertzel' (strongest tone energy); the Goertzel bank also
+# weighs the tones of a window straddling two symbols for the symbol clock
+class WindowDemodulator:
+    __slots__ = ('demod', 'window_length', 'symbol_bits', '_window', '_spectrum', '_magnitude', '_symbol_of_bin',
+                 '_end_of_bin', '_bank', '_projections', '_cosines', '_sines', '_energies', '_data_energies')
+
+    def __init__(self, profile=DEFAULT_PROFILE, demod='fft'):
+        self.demod = demod
+        self.window_length = length = profile.frames_per_symbol
+        # Row i holds the bits of symbol value i
+        self.symbol_bits = symbols_to_bits(np.arange(len(profile.tones)), profile.bits_per_symbol).reshape(
+            len(profile.tones), profile.bits_per_symbol)
+        self._window = np.zeros(length)
+        freqs = demod_tones(profile)
+        self._bank = goertzel_bank(length, freqs, profile.rate)
+        self._projections = np.empty(2 * len(freqs))
+        self._cosines = self._projections[:len(freqs)]
+        self._sines = self._projections[len(freqs):]
+        self._energies = np.empty(len(freqs))
+        self._data_energies = self._energies[:len(profile.tones)]
+        if demod != 'goertzel':
+            # Symbol value and end marker decision for a spectral peak in each bin of a real FFT of one window
+            freqs = np.fft.rfftfreq(length, 1 / profile.rate)
+            self._symbol_of_bin = np.argmin(np.abs(freqs[:, None] - np.asarray(profile.tones)), axis=1)
+            self._end_of_bin = end_marker_symbols(freqs, profile, 'fft')
+            self._spectrum = np.empty(len(freqs), dtype=np.complex128)
+            self._magnitude = np.empty(len(freqs))
+            try:
+                np.fft.rfft(self._window, out=self._spectrum)
+            except TypeError:
+                self._spectrum = None  # NumPy before 2.0 has no out= on its FFTs, so each spectrum is allocated
+
+    # Function to classify one window of window_length samples: whether it belongs to the end marker, and the symbol
+    # value it decodes to
+    def classify(self, samples):
+        if self.demod == 'goertzel':
+            self.energies(samples)
+            # The strongest tone is not a data tone at the end marker
+            return self._energies.argmax() >= len(self._data_energies), int(self._data_energies.argmax())
+
+        np.copyto(self._window, samples)
+        if self._spectrum is None:
+            spectrum = np.fft.rfft(self._window)
+        else:
+            spectrum = np.fft.rfft(self._window, out=self._spectrum)
+        np.abs(spectrum, out=self._magnitude)
+        peak = self._magnitude.argmax()
+        return bool(self._end_of_bin[peak]), int(self._symbol_of_bin[peak])
+
+    # Function to get the energy of each data tone in one window of window_length samples (a buffer reused by the
+    # next call)
+    def energies(self, samples):
+        np.copyto(self._window, samples)
+        np.dot(self._window, self._bank, out=self._projections)
+        np.square(self._projections, out=self._projections)
+        np.add(self._cosines, self._sines, out=self._energies)
+        return self._data_energies
+
+# Function to decode audio from a file (file-based decoding); demod is 'fft' (spectral peak) or 'goertzel' (tone
+# energies)
+# With batched=True the whole file is demodulated in one pass instead of one window at a time
+# The file's codec profile selects the mode; for files without one, the fallback profile or else the default profile of
+# modulation and mfsk is used and must then match what the file was encoded with ('ofdm' and DPSK files are always
+# decoded in one pass)
+# framed must match the encoder's: a frame is checked and unwrapped (raising FrameError if it is damaged), and with
+# framed=False the data is returned as demodulated
+def decode_audio_from_file(filename, demod='fft', batched=False, mfsk=2, modulation='fsk', fallback=None,
+                           framed=True):
+    with MappedWav(filename) as wav_file:
+        profile = read_codec_profile(wav_file, mfsk, modulation, fallback)
+    if profile.modulation == 'ofdm':
+        return decode_ofdm_from_file(filename, profile, framed=framed)
+    if profile.modulation in DPSK_MODES:
+        return decode_dpsk_from_file(filename, profile=profile, framed=framed)
+    if batched:
+        return decode_audio_from_file_batched(filename, demod, profile=profile, framed=framed)
+
+    with MappedWav(filename) as wav_file:
+        frames_per_bit = profile.frames_per_symbol
+        decoded_bits = BitBuffer()
+        
+        # First, read and skip the start marker, and tune to the tones it came in at
+        skip_marker_file_based(wav_file, profile.start_marker, profile)
+        marker_start = wav_file.tell() - len(profile.start_marker) * profile.frames_per_marker_tone
+        profile = tune_profile(wav_file.samples, marker_start, profile)
+
+        if demod == 'goertzel':
+            decoded_bits = decode_bits_goertzel(wav_file, profile, framed)
+        else:
+            demodulator = WindowDemodulator(profile, demod)
+            clock = SymbolClock(profile)
+            samples = wav_file.samples
+            pos = wav_file.tell()
+            frame_bits = None  # Bits in the frame once its header is in, 0 for raw data or a damaged header
+            while pos + frames_per_bit <= len(samples):
+                # Check for the end marker and stop decoding if found (a frame knows its own length instead)
+                is_end_marker, symbol = demodulator.classify(samples[pos:pos + frames_per_bit])
+                if is_end_marker and not frame_bits:
+                    break
+
+                # A change of tone lets the symbol clock measure how far the boundary in front of this window is off
+                if clock.last >= 0 and symbol != clock.last:
+                    boundary = pos - frames_per_bit // 2
+                    energies = demodulator.energies(samples[boundary:boundary + frames_per_bit])
+                    clock.measure(energies[clock.last], energies[symbol])
+                clock.last = symbol
+                pos += frames_per_bit + clock.advance(1)
+
+                # Append the bits carried by the closest data tone
+                decoded_bits.extend(demodulator.symbol_bits[symbol])
+                if frame_bits is None:
+                    frame_bits = frame_bit_count(decoded_bits.view(), framed)
+                    if frame_bits:
+                        decoded_bits.reserve(frame_bits)
+                if frame_bits and len(decoded_bits) >= frame_bits:
+                    break
+        
+        # Convert the bits to bytes, checking and unwrapping a frame
+        decoded_data = unframe(decoded_bits.to_bytes(), framed)
+    
+    return decoded_data
+
+# Function to get the normalized correlation of the samples with a marker sequence at count lags from offset
+# With a correlator of the marker, whose block must hold count lags, the result is in its buffer reused by the next call
+def marker_scores(samples, offset, count, marker_freqs, profile=DEFAULT_PROFILE, correlator=None):
+    if correlator is None:
+        correlator = MarkerCorrelator(marker_freqs, profile, count)
+    return correlator.scores(samples, offset, count)
+
+# Function to get how well an end marker matches at sample offset: its best normalized correlation within half a
+# marker tone either way, since a drifting clock moves the end template's peak off the lag where the start template
+# peaks. The two markers share most of their tones: a start marker scores at most about 0.65 times as well against the
+# end template as against its own, while parts of an end marker score at least as well against it
+def end_marker_score(samples, offset, profile=DEFAULT_PROFILE, correlator=None):
+    half = profile.frames_per_marker_tone // 2
+    first = max(offset - half, 0)
+    return float(np.max(marker_scores(samples, first, offset + half + 1 - first, profile.end_marker, profile,
+                                      correlator), initial=0.0))
+
+# Function to find the sample offsets of all start markers that begin in samples[start:stop]
+# The search reaches past both ends, so a marker crossing either end is seen whole and found at the same offset as
+# from the neighbouring range; it belongs to the range it begins in, so neighbouring shards never both report it
+# With limit, the search stops once that many markers are found; correlators, the MarkerCorrelators of the profile's
+# start and end markers, are reused instead of setting up new ones
+def find_start_markers(samples, profile, start=0, stop=None, limit=None, correlators=(None, None)):
+    start_correlator, end_correlator = correlators
+    stop = len(samples) if stop is None else stop
+    length = len(profile.start_marker) * profile.frames_per_marker_tone
+    # Every lag up to one marker length past stop has a whole marker length of samples to correlate against
+    samples = samples[:stop + 2 * length]
+    offsets = []
+    pos = max(start - length, 0)
+    while True:
+        offset = acquire_marker(samples, profile.start_marker, pos, profile=profile, correlator=start_correlator)
+        if offset is None:
+            return offsets
+        # Depending on where the search began, acquire_marker can settle on a partial match (the start marker repeats
+        # its first half, and the end marker shares most of its tones) before the marker itself; moving on to the
+        # best match within the next marker length until there is none better reaches the marker
+        while True:
+            scores = marker_scores(samples, offset, length + 1, profile.start_marker, profile, start_correlator)
+            best = int(np.argmax(scores))
+            if best == 0:
+                break
+            offset += best
+        if offset >= stop:
+            return offsets
+        if offset >= start and (end_marker_score(samples, offset, profile, end_correlator)
+                                < END_MARKER_REJECTION * scores[0]):
+            offsets.append(offset)
+            if len(offsets) == limit:
+                return offsets
+        pos = offset + length
+
+# Function to decode the transmission whose start marker is at sample offset, with the whole-file decoder of its mode
+def decode_transmission(filename, profile, offset, demod='goertzel', framed=True):
+    if profile.modulation == 'ofdm':
+        return decode_ofdm_from_file(filename, profile, offset, framed)
+    if profile.modulation in DPSK_MODES:
+        return decode_dpsk_from_file(filename, profile=profile, offset=offset, framed=framed)
+    return decode_audio_from_file_batched(filename, demod, profile=profile, offset=offset, framed=framed)
+
+# Function to decode the transmissions whose start markers begin in samples [start, stop) of a recording
+# Runs in a worker process; a transmission may run on past stop, since the whole file is mapped
+# Returns (offset, data, error) for each, where a transmission that fails its frame check has data None
+def decode_shard(filename, start, stop, demod='goertzel', mfsk=2, modulation='fsk', framed=True):
+    with MappedWav(filename) as wav_file:
+        profile = read_codec_profile(wav_file, mfsk, modulation)
+        # Markers are only searched for where the pre-scan finds activity; the regions are disjoint, so each marker
+        # begins in one of them, and the correlators are set up once for all of them
+        correlators = (MarkerCorrelator(profile.start_marker, profile, ACQUISITION_BLOCK),
+                       MarkerCorrelator(profile.end_marker, profile))
+        offsets = [offset for begin, end in find_active_regions(wav_file.samples, profile, start, stop)
+                   for offset in find_start_markers(wav_file.samples, profile, begin, end, correlators=correlators)]
+    results = []
+    for offset in offsets:
+        try:
+            results.append((offset, decode_transmission(filename, profile, offset, demod, framed), None))
+        except FrameError as error:
+            results.append((offset, None, str(error)))
+    return results
+
+# Function to decode every transmission in a long recording: the data chunk is split into SHARD_SECONDS shards,
+# which worker processes search for start markers and demodulate in parallel (workers defaults to the CPU count)
+# Returns (offset, data, error) for each transmission in order of its start marker's sample offset
+def decode_transmissions(filename, demod='goertzel', mfsk=2, modulation='fsk', workers=None, framed=True):
+    with MappedWav(filename) as wav_file:
+        n_frames = wav_file.getnframes()
+        shard = SHARD_SECONDS * wav_file.getframerate()
+    bounds = [(start, min(start + shard, n_frames)) for start in range(0, n_frames, shard)]
+    if len(bounds) <= 1:
+        shards = [decode_shard(filename, 0, n_frames, demod, mfsk, modulation, framed)]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+            futures = [executor.submit(decode_shard, filename, start, stop, demod, mfsk, modulation, framed)
+                       for start, stop in bounds]
+            shards = [future.result() for future in futures]
+
+    # Shards own the markers that begin in them, so keying by offset only drops a marker reported twice
+    transmissions = {}
+    for results in shards:
+        for result in results:
+            transmissions.setdefault(result[0], result)
+    return [transmissions[offset] for offset in sorted(transmissions)]
+
+# Streaming decoder: takes 16-bit samples in chunks of any size, from a file, a sound card or a network socket, and
+# returns each payload as soon as its transmission is complete
+# It searches for a start marker, demodulates the symbols after it until the frame (or, for raw data, the end marker)
+# is complete, then searches again; only the samples it cannot use yet are kept from one chunk to the next
+# framed must match the encoder's, as for the file decoders
+class Decoder:
+    __slots__ = ('profile', 'demod', 'framed', '_buffer', '_start', '_end', '_receiving', '_bits', '_frame_bits',
+                 '_reference', '_level', '_final', '_payloads', '_error', '_marker_length', '_end_marker_length',
+                 '_symbol_length', '_demodulator', '_clock', '_tuned', '_discard', '_odd_byte', '_correlators', '_rows',
+                 '_ends', '_starts')
+
+    def __init__(self, profile=None, mfsk=2, modulation='fsk', demod='fft', framed=True):
+        self.profile = profile = CodecProfile(modulation, mfsk) if profile is None else profile
+        self.demod = demod
+        self.framed = framed
+        frames = profile.frames_per_symbol
+        self._marker_length = len(profile.start_marker) * profile.frames_per_marker_tone
+        self._end_marker_length = len(profile.end_marker) * profile.frames_per_marker_tone
+        self._symbol_length = frames + (ofdm_prefix(profile) if profile.modulation == 'ofdm' else 0)
+        self._demodulator = None  # Demodulator of the mode, tuned to each transmission
+        # Set up once, so a long-running receiver allocates no arrays per search or FSK symbol: the marker correlators,
+        # and a row per FSK symbol demodulated at once (at least the symbols of a frame header) telling whether it
+        # looks like the end marker and where it starts
+        self._correlators = (MarkerCorrelator(profile.start_marker, profile),
+                             MarkerCorrelator(profile.end_marker, profile))
+        self._rows = max(TIMING_BLOCK, -(-FRAME_HEADER_BITS // profile.bits_per_symbol))
+        self._ends = np.zeros(self._rows, dtype=bool)
+        self._starts = np.zeros(self._rows, dtype=np.intp)
+        self._buffer = np.empty(4 * self._marker_length, dtype=np.int16)
+        self._start = 0
+        self._end = 0
+        # Samples still to come that are skipped rather than read: the rest of an end marker, or the part of a shift of
+        # the symbol clock that goes past the samples at hand
+        self._discard = 0
+        self._odd_byte = b''  # First byte of a sample split between two chunks of bytes
+        self._bits = BitBuffer()
+        self._payloads = []
+        self._error = None
+        self._final = False
+        self.reset()
+
+    # Function to drop the transmission in progress, if any, and search for the next start marker
+    def reset(self):
+        self._receiving = False
+        self._bits.clear()
+        self._frame_bits = None  # Bits in the frame once its header is in, 0 for raw data or a damaged header
+        self._reference = None  # Last symbols demodulated, which the next OFDM or DPSK symbols are compared with
+        self._level = None  # Level of the DPSK reference symbol, against which the carrier fading out is measured
+        self._tune(self.profile)
+
+    # Function to demodulate the next transmission with profile: the decoder's profile, or that profile tuned to the
+    # tones the transmission's start marker came in at
+    def _tune(self, profile):
+        self._tuned = profile
+        self._clock = SymbolClock(profile)
+        if profile.modulation == 'fsk':
+            self._demodulator = WindowDemodulator(profile, self.demod)
+        elif profile.modulation == 'ofdm':
+            self._demodulator = OfdmDemodulator(profile)
+        else:
+            self._demodulator = DpskDemodulator(profile)
+
+    # Function to take the next chunk of samples (an int16 array or little-endian 16-bit PCM bytes, which may split a
+    # sample between two chunks)
+    # Returns the payloads of the transmissions it completed; a transmission that fails its frame check raises
+    # FrameError instead, after which feeding can go on (payloads completed earlier come out of the next call)
+    def feed(self, samples):
+        if not isinstance(samples, np.ndarray):
+            if self._odd_byte:
+                samples = self._odd_byte + bytes(samples)
+            self._odd_byte = bytes(samples[len(samples) & ~1:])
+            samples = np.frombuffer(samples, dtype='<i2', count=len(samples) // 2)
+        if self._start == self._end:
+            # Nothing is left over from the previous chunk, so this one is read in place
+            view = samples
+        else:
+            self._append(samples)
+            view = self._buffer[self._start:self._end]
+        used = self._process(view)
+        if view is samples:
+            self._start = self._end = 0
+            self._append(samples[used:])
+        else:
+            self._start += used
+        return self._take_payloads()
+
+    # Function to end the stream: a raw transmission cut off by it is returned with the other completed payloads,
+    # a frame cut off by it raises FrameError, and the samples left over are dropped
+    def finish(self):
+        self._final = True
+        try:
+            self._process(self._buffer[self._start:self._end])
+            if self._receiving and self._error is None:
+                data = self._bits.to_bytes()
+                self.reset()
+                self._payloads.append(unframe(data, self.framed))
+        finally:
+            self._final = False
+            self._start = self._end = self._discard = 0
+            self._odd_byte = b''
+            self.reset()
+        return self._take_payloads()
+
+    # Function to hand out the completed payloads, or raise the error of the transmission that failed
+    def _take_payloads(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+        payloads, self._payloads = self._payloads, []
+        return payloads
+
+    # Function to keep samples for the next call, growing the buffer only when the samples kept would not fit
+    def _append(self, samples):
+        kept = self._end - self._start
+        if self._end + len(samples) > len(self._buffer):
+            if kept + len(samples) > len(self._buffer):
+                buffer = np.empty(max(2 * len(self._buffer), kept + len(samples)), dtype=np.int16)
+            else:
+                buffer = self._buffer
+            buffer[:kept] = self._buffer[self._start:self._end]
+            self._buffer = buffer
+            self._start, self._end = 0, kept
+        self._buffer[self._end:self._end + len(samples)] = samples
+        self._end += len(samples)
+
+    # Function to run the search and demodulation over samples; returns how many of them were used up
+    def _process(self, samples):
+        pos = 0
+        while self._error is None:
+            if self._discard:
+                skipped = min(self._discard, len(samples) - pos)
+                if not skipped:
+                    break
+                self._discard -= skipped
+                pos += skipped
+                continue
+            new_pos = self._receive(samples, pos) if self._receiving else self._search(samples, pos)
+            if new_pos is None:
+                break
+            pos = new_pos
+        return pos
+
+    # Function to look for a start marker in samples[pos:]; returns the position to go on from, None for more samples
+    def _search(self, samples, pos):
+        length = self._marker_length
+        # Markers beginning before stop are whole, and found where a search over more samples would find them
+        # (at the end of the stream, there are no more samples to wait for)
+        stop = len(samples) - pos - (length if self._final else 2 * length)
+        if stop < (1 if self._final else length):
+            return None
+        offsets = find_start_markers(samples[pos:], self.profile, 0, stop, limit=1, correlators=self._correlators)
+        if not offsets:
+            return pos + stop
+        self._receiving = True
+        self._tune(tune_profile(samples, pos + offsets[0], self.profile))
+        return pos + offsets[0] + length
+
+    # Function to demodulate the next symbols in samples[pos:]; returns the position to go on from, None for more
+    # samples
+    def _receive(self, samples, pos):
+        bits_per_symbol = self.profile.bits_per_symbol
+        available = (len(samples) - pos) // self._symbol_length
+        # OFDM and DPSK send a reference symbol first, which carries no data
+        reference = int(self._reference is None and self.profile.modulation != 'fsk')
+        if self._frame_bits is None:
+            # The frame header is read first, in one piece, so the raw data end can still be found among its symbols
+            count = reference + -(-(FRAME_HEADER_BITS - len(self._bits)) // bits_per_symbol)
+            if available < count:
+                if not self._final:
+                    return None
+                count = available
+        elif self._frame_bits:
+            count = min(available, reference + -(-(self._frame_bits - len(self._bits)) // bits_per_symbol))
+        else:
+            count = min(available, BATCHED_DECODE_ROWS)
+        if count == 0:
+            return None
+
+        # The windows follow the sender's symbol clock, so where they end is only known once they are demodulated (the
+        # first one always fits, and fewer symbols come back where a shift takes the rest past the samples at hand)
+        received = len(self._bits)
+        if self.profile.modulation == 'fsk':
+            starts, next_pos = self._classify(samples, pos, min(count, self._rows))
+            is_end, carriers = self._ends[:len(starts)], None
+        else:
+            starts, next_pos, is_end, carriers = self._demodulate(samples, pos, count)
+        count = len(starts)
+        next_pos = self._go_to(samples, next_pos)
+        if self._frame_bits is None:
+            self._frame_bits = frame_bit_count(self._bits.view(), self.framed)
+            if self._frame_bits:
+                self._bits.reserve(self._frame_bits)
+            elif self._final:
+                self._frame_bits = 0
+
+        if self._frame_bits:
+            if len(self._bits) < self._frame_bits:
+                return next_pos
+            # Symbols past the end of the frame belong to the end marker, which starts where the clock put the first
+            used = count - len(is_end) + -(-(self._frame_bits - received) // bits_per_symbol)
+            end_marker = starts[used] if used < count else next_pos + self._discard
+            data = bits_to_bytes(self._bits.view()[:self._frame_bits])
+            self.reset()
+            try:
+                self._payloads.append(unframe(data, self.framed))
+            except FrameError as error:
+                self._error = error
+            return self._after_end_marker(samples, end_marker)
+
+        # Raw data ends at the first symbol that belongs to the end marker (a frame too short to fill the symbols
+        # its header is read from ends there too, and is still checked and unwrapped)
+        if self._frame_bits is None or not is_end.any():
+            return next_pos
+        end = np.flatnonzero(is_end)
+        end_marker = starts[count - len(is_end) + end[0]]
+        bits = self._bits.view()[:received + end[0] * bits_per_symbol]
+        if carriers is not None and len(bits):
+            # Subcarriers left silent in the last OFDM symbol carry no data
+            active = self._demodulator.active(carriers[:len(carriers) - len(is_end) + end[0]])
+            bits = np.concatenate((bits[:-len(active)], bits[-len(active):][active]))
+        self.reset()
+        try:
+            self._payloads.append(unframe(bits_to_bytes(bits), self.framed))
+        except FrameError as error:
+            self._error = error
+        return self._after_end_marker(samples, end_marker)
+
+    # Function to go on past the end marker that begins at samples[pos], which may run on past the samples at hand
+    # The clock can put the end marker a few samples late, and a start marker can follow it with no gap; the search
+    # cannot look back, so it begins a marker tone early, where end marker rejection turns down the end marker's tail
+    def _after_end_marker(self, samples, pos):
+        return self._go_to(samples, pos + self._end_marker_length - self.profile.frames_per_marker_tone)
+
+    # Function to go on from samples[pos], skipping the samples still to come where pos lies past the ones at hand
+    def _go_to(self, samples, pos):
+        self._discard = max(pos - len(samples), 0)
+        return min(pos, len(samples))
+
+    # Function to demodulate up to count FSK symbols from samples[pos:], one window at a time into the bits and the end
+    # marker rows, re-centring the windows on the sender's symbol clock; returns the position of each symbol and of the
+    # next one
+    def _classify(self, samples, pos, count):
+        demodulator, clock, length = self._demodulator, self._clock, self._symbol_length
+        done = 0
+        while done < count and pos + length <= len(samples):
+            is_end, symbol = demodulator.classify(samples[pos:pos + length])
+            # A change of tone lets the symbol clock measure how far the boundary in front of this window is off
+            if clock.last >= 0 and symbol != clock.last and pos >= length // 2:
+                boundary = pos - length // 2
+                energies = demodulator.energies(samples[boundary:boundary + length])
+                clock.measure(energies[clock.last], energies[symbol])
+            clock.last = symbol
+            self._ends[done] = is_end
+            self._starts[done] = pos
+            self._bits.extend(demodulator.symbol_bits[symbol])
+            done += 1
+            pos += length + clock.advance(1)
+        return self._starts[:done], pos
+
+    # Function to demodulate up to count OFDM or DPSK symbols from samples[pos:] (with the reference symbol first) into
+    # the bits, re-centring the windows on the sender's symbol clock
+    # Returns the position of each symbol and of the next one, which data symbols look like the end marker, and for
+    # OFDM the subcarriers of the symbols compared, starting with the ones kept from before
+    def _demodulate(self, samples, pos, count):
+        demodulator = self._demodulator
+        if self.profile.modulation == 'ofdm':
+            carriers, end_energy, starts, pos = demodulator.track(samples, pos, count, self._clock)
+            if self._reference is None:
+                self._reference, carriers, end_energy = carriers[:1], carriers[1:], end_energy[1:]
+            # Keep the last two symbols: the next one is compared with the last, and the last with the one before
+            history = np.concatenate((self._reference, carriers))
+            self._bits.extend(ofdm_turned(history[len(self._reference) - 1:]).ravel())
+            self._reference = history[-2:]
+            return starts, pos, demodulator.is_end(carriers, end_energy), history
+
+        baseband, starts, pos = demodulator.track(samples, pos, count, self._clock)
+        if self._reference is None:
+            self._reference, self._level, baseband = baseband[0], np.abs(baseband[0]), baseband[1:]
+        history = np.concatenate(([self._reference], baseband))
+        self._reference = history[-1]
+        self._bits.extend(demodulator.bits(history))
+        return starts, pos, demodulator.is_end(baseband, self._level), None
+
+# Function to decode audio in real-time
+# Capture runs on PyAudio's callback thread and feeds a bounded ring buffer; a separate DSP worker
+# thread feeds what has been captured to a Decoder, and this thread reports queue depth, drops and overflows
+# Nothing but the audio reaches the receiver, so a profile other than the default FSK mode must be passed in
+def decode_audio_in_real_time(demod='fft', mfsk=2, profile=None, framed=True):
+    decoder = Decoder(profile, mfsk, demod=demod, framed=framed)
+    profile = decoder.profile
+
+    # The ring buffer holds RING_BUFFER_SECONDS of audio, and at least what a marker search needs on top of one capture
+    # buffer
+    marker_length = len(profile.start_marker) * profile.frames_per_marker_tone
+    ring = SampleRingBuffer(max(int(profile.rate * RING_BUFFER_SECONDS), 4 * marker_length + CAPTURE_FRAMES))
+    stats = ReceiverStats()
+    pyaudio, audio = get_audio_backend()
+
+    # Called by PyAudio with every captured buffer
+    def capture(in_data, frame_count, time_info, status_flags):
+        stats.captured_buffers += 1
+        if status_flags & pyaudio.paInputOverflow:
+            stats.input_overflows += 1
+        if not ring.write(np.frombuffer(in_data, dtype=np.int16)):
+            stats.dropped_buffers += 1
+        stats.max_queue_depth = max(stats.max_queue_depth, ring.available())
+        return (None, pyaudio.paContinue)
+
+    # Open a stream for audio recording
+    stream = audio.open(format=pyaudio.paInt16,
+                        channels=1,
+                        rate=profile.rate,
+                        input=True,
+                        frames_per_buffer=CAPTURE_FRAMES,
+                        stream_callback=capture)
+
+    result = {}
+
+    # Feed everything captured so far to the decoder until it completes a transmission
+    def dsp_worker():
+        try:
+            while True:
+                ring.wait(CAPTURE_FRAMES)
+                started = time.perf_counter()
+                # Samples wrapping around the ring's end are fed in two goes rather than copied together
+                samples = ring.peek(ring.contiguous())
+                payloads = decoder.feed(samples)
+                ring.advance(len(samples))
+                stats.dsp_seconds += time.perf_counter() - started
+                if payloads:
+                    result['data'] = payloads[0]
+                    return
+        except BaseException as error:
+            result['error'] = error
+
+    worker = threading.Thread(target=dsp_worker, name="TranSSound DSP", daemon=True)
+    stream.start_stream()
+    worker.start()
+    try:
+        while worker.is_alive():
+            worker.join(RECEIVER_REPORT_SECONDS)
+            if worker.is_alive():
+                print("Receiver:", stats.summary(ring, profile.rate))
+    finally:
+        # Close the stream after listening
+        stream.stop_stream()
+        stream.close()
+
+    print("Receiver:", stats.summary(ring, profile.rate))
+    if stats.dropped_buffers or stats.input_overflows:
+        print("Warning: audio was lost during capture; the decoded data may be incomplete")
+    if 'error' in result:
+        raise result['error']
+
+    decoded_data = result['data']
+    print("Decoded data:", decoded_data)
+    return decoded_data
+
+# Function to measure throughput and bit error rate of every M-FSK mode over a simulated noisy channel
+# Each mode encodes the same random payload, white noise is added at each SNR (measured over the full band), the
+# mix is scaled to a quarter of full scale so it never clips, and the file decoder counts bit errors;
+# bits missing from a truncated decode count as half an error
+def measure_mfsk_modes(snr_db_values=(-6, -9, -12, -15), payload_size=512, demod='goertzel', seed=0):
+    rng = np.random.default_rng(seed)
+    payload = rng.integers(0, 256, payload_size, dtype=np.uint8).tobytes()
+    payload_bits = bytes_to_bits(payload)
+    rows = []
+    with tempfile.TemporaryDirectory() as directory:
+        clean_filename = os.path.join(directory, 'clean.wav')
+        noisy_filename = os.path.join(directory, 'noisy.wav')
+        for mfsk in (2, 4, 8, 16):
+            # Raw data, so that bit errors are counted instead of failing the frame check
+            encode_binary_to_audio(payload, clean_filename, mfsk, framed=False)
+            with MappedWav(clean_filename) as wav_file:
+                signal = wav_file.samples.astype(np.float64)
+            signal_power = np.mean(signal ** 2)
+
+            profile = CodecProfile('fsk', mfsk)
+            bit_rates = profile.bits_per_symbol / profile.duration
+            error_rates = []
+            for snr_db in snr_db_values:
+                noise_power = signal_power / 10 ** (snr_db / 10)
+                received = signal + rng.normal(0, np.sqrt(noise_power), len(signal))
+                received *= (AMPLITUDE / 4) / np.sqrt(signal_power + noise_power)
+                with wave.open(noisy_filename, 'w') as wav_file:
+                    wav_file.setnchannels(1)
+                    wav_file.setsampwidth(2)
+                    wav_file.setframerate(profile.rate)
+                    wav_file.writeframes(np.clip(received, -32768, 32767).astype('<i2').tobytes())
+
+                decoded = decode_audio_from_file(noisy_filename, demod, mfsk=mfsk, framed=False)
+                decoded_bits = bytes_to_bits(decoded)[:len(payload_bits)]
+                errors = np.count_nonzero(decoded_bits != payload_bits[:len(decoded_bits)])
+                errors += 0.5 * (len(payload_bits) - len(decoded_bits))
+                error_rates.append(errors / len(payload_bits))
+            rows.append((mfsk, bit_rates, error_rates))
+
+    print("Mode     bit/s  " + "  ".join(f"BER @ {snr_db:>3} dB" for snr_db in snr_db_values))
+    for mfsk, bit_rates, error_rates in rows:
+        print(f"{mfsk:>2}-FSK  {bit_rates:>5.0f}  " + "  ".join(f"{error_rate:>12.2e}" for error_rate in error_rates))
+    return rows
+
+# Function to list the WAV recordings to decode: paths are files or directories, whose .wav files are taken
+def find_recordings(paths):
+    filenames = []
+    for path in paths:
+        if os.path.isdir(path):
+            names = sorted(name for name in os.listdir(path) if name.lower().endswith('.wav'))
+            filenames.extend(os.path.join(path, name) for name in names)
+        else:
+            filenames.append(path)
+    return filenames
+
+# Function to get the file decode_batch saves the data of a recording to, unless another recording already took it
+def batch_output_path(filename, output_dir=None):
+    output = os.path.splitext(filename)[0] + '.bin'
+    if output_dir is not None:
+        output = os.path.join(output_dir, os.path.basename(output))
+    return output
+
+# Function to decode the first transmission of one recording for decode_batch and save its data to output; runs in a
+# worker process
+# The profile options are those of decode_audio_from_file; a recording without a start marker is a failure, not an
+# empty transmission
+# Returns the manifest record of the recording; errors are recorded instead of raised
+def decode_batch_file(filename, output, demod='goertzel', mfsk=2, modulation='fsk', fallback=None, framed=True):
+    started = time.perf_counter()
+    record = {'file': filename}
+    try:
+        with MappedWav(filename) as wav_file:
+            profile = read_codec_profile(wav_file, mfsk, modulation, fallback)
+            offset = search_marker(wav_file.samples, profile.start_marker, 0, profile)
+        if offset is None:
+            record.update(ok=False, error="no transmission found")
+        else:
+            data = decode_transmission(filename, profile, offset, demod, framed)
+            with open(output, 'wb') as file:
+                file.write(data)
+            record.update(ok=True, output=output, bytes=len(data))
+    except Exception as error:
+        record.update(ok=False, error=f"{type(error).__name__}: {error}")
+    record['seconds'] = round(time.perf_counter() - started, 3)
+    return record
+
+# Function to decode many recordings in parallel, one per worker process (workers defaults to the number of CPUs)
+# paths are WAV files or directories of them; each record is appended to the JSON-lines manifest as soon as its
+# recording is done (by default BATCH_MANIFEST in output_dir, or in the current directory)
+# The data of each recording is saved next to it, or in output_dir, with the extension replaced by .bin; recordings of
+# the same name from different directories get _2, _3 and so on added to the names of the later ones' outputs
+# Returns the manifest records in the order of the recordings
+def decode_batch(paths, output_dir=None, manifest=None, workers=None, demod='goertzel', mfsk=2, modulation='fsk',
+                 fallback=None, framed=True):
+    filenames = find_recordings(paths)
+    if output_dir is not None:
+        os.makedirs(output_dir, exist_ok=True)
+    if manifest is None:
+        manifest = os.path.join(output_dir or os.curdir, BATCH_MANIFEST)
+
+    started = time.perf_counter()
+    records = [None] * len(filenames)
+    outputs = []
+    taken = set()
+    for filename in filenames:
+        output = base = batch_output_path(filename, output_dir)
+        copy = 1
+        while os.path.normcase(os.path.abspath(output)) in taken:
+            copy += 1
+            output = f"{os.path.splitext(base)[0]}_{copy}.bin"
+        taken.add(os.path.normcase(os.path.abspath(output)))
+        outputs.append(output)
+
+    with open(manifest, 'w') as manifest_file, \
+            concurrent.futures.ProcessPoolExecutor(workers) as executor:
+        futures = {executor.submit(decode_batch_file, filename, output, demod, mfsk, modulation, fallback, framed): i
+                   for i, (filename, output) in enumerate(zip(filenames, outputs))}
+        for future in concurrent.futures.as_completed(futures):
+            record = future.result()
+            records[futures[future]] = record
+            manifest_file.write(json.dumps(record) + '\n')
+            manifest_file.flush()
+            print(f"{'Decoded' if record['ok'] else 'Failed'}: {record['file']} ({record['seconds']:.2f} s)")
+
+    decoded = sum(record['ok'] for record in records)
+    print(f"Decoded {decoded} of {len(records)} recordings in {time.perf_counter() - started:.1f} s; "
+          f"manifest saved to {manifest}")
+    return records
+
+# Function to play a WAV file (a filename or a readable binary file object, such as a pipe) through the sound card
+# The audio is read and written PLAYBACK_FRAMES at a time, so streams of any length can be played
+def play_audio_file(source):
+    pyaudio, audio = get_audio_backend()
+    with wave.open(source, 'rb') as wav_file:
+        if wav_file.getsampwidth() != 2:
+            raise wave.Error("only 16-bit PCM is supported")
+        stream = audio.open(format=pyaudio.paInt16,
+                            channels=wav_file.getnchannels(),
+                            rate=wav_file.getframerate(),
+                            output=True,
+                            frames_per_buffer=PLAYBACK_FRAMES)
+        try:
+            while True:
+                frames = wav_file.readframes(PLAYBACK_FRAMES)
+                if not frames:
+                    break
+                stream.write(frames)
+        finally:
+            stream.stop_stream()
+            stream.close()
+
+# Function to build the codec profile selected by command-line arguments, at rate unless --rate is given
+def profile_from_args(args, rate=RATE):
+    if args.rate is not None:
+        rate = args.rate
+    return CodecProfile(args.modulation, args.mfsk, rate=rate, duration=args.duration,
+                        marker_duration=args.marker_duration)
+
+# Function to write decoded data to a file, or to stdout (the binary standard output) for '-'
+def write_output(data, output, stdout):
+    if output == '-':
+        stdout.write(data)
+        stdout.flush()
+    else:
+        with open(output, 'wb') as file:
+            file.write(data)
+
+# Function to run the encode command: data from a file or standard input ('-') to a WAV file or standard output
+def run_encode(args, stdin, stdout):
+    output = stdout if args.output == '-' else args.output
+    if args.input == '-':
+        encode_binary_to_audio(stdin, output, profile=profile_from_args(args), framed=not args.raw, fec=args.fec,
+                               compress=args.compress)
+    else:
+        with open(args.input, 'rb') as file:
+            encode_binary_to_audio(file, output, profile=profile_from_args(args), framed=not args.raw,
+                                   fec=args.fec, compress=args.compress)
+
+# Function to decode a WAV file with the command-line options; the profile options describe files without a profile
+# of their own, at the file's sample rate unless --rate is given
+def decode_file_from_args(filename, args):
+    with MappedWav(filename) as wav_file:
+        rate = wav_file.getframerate()
+    return decode_audio_from_file(filename, args.demod, args.batched, fallback=profile_from_args(args, rate),
+                                  framed=not args.raw)
+
+# Function to run the decode command: a WAV file, or one read from standard input ('-'), to a file or standard output
+def run_decode(args, stdin, stdout):
+    if args.input != '-':
+        write_output(decode_file_from_args(args.input, args), args.output, stdout)
+        return
+    # The decoders map the recording into memory, so a piped one is copied block by block to a temporary file first
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, 'input.wav')
+        with open(filename, 'wb') as file:
+            shutil.copyfileobj(stdin, file)
+        write_output(decode_file_from_args(filename, args), args.output, stdout)
+
+# Function to run the listen command: decode from the microphone to a file or standard output
+def run_listen(args, stdin, stdout):
+    write_output(decode_audio_in_real_time(args.demod, profile=profile_from_args(args), framed=not args.raw),
+                 args.output, stdout)
+
+# Function to run the batch command: decode WAV files and directories of them in parallel; returns 1 if any failed
+# The profile options describe recordings without a profile of their own, each at its own sample rate unless --rate
+# (or another timing option, which needs a full profile) is given
+def run_batch(args, stdin, stdout):
+    fallback = None
+    if args.rate is not None or args.duration is not None or args.marker_duration != DURATION:
+        fallback = profile_from_args(args)
+    records = decode_batch(args.paths, args.output_dir, args.manifest, args.workers, args.demod, args.mfsk,
+                           args.modulation, fallback, not args.raw)
+    return 0 if all(record['ok'] for record in records) else 1
+
+# Function to run the play command: play a WAV file, or one streamed on standard input ('-')
+def run_play(args, stdin, stdout):
+    play_audio_file(stdin if args.input == '-' else args.input)
+
+# Function to build the command-line parser, with one subcommand per action
+def build_parser():
+    parser = argparse.ArgumentParser(prog='tranSSound', description="Send data over sound.")
+    commands = parser.add_subparsers(dest='command', metavar='command')
+
+    # Options that select the codec profile, shared by the commands that need one
+    profile_options = argparse.ArgumentParser(add_help=False)
+    profile_options.add_argument('--modulation', choices=['fsk', 'ofdm', *DPSK_MODES], default='fsk',
+                                 help="modulation (default: fsk); decode only uses these for files without a profile")
+    profile_options.add_argument('--mfsk', type=int, choices=[2, 4, 8, 16], default=2,
+                                 help="data tones of the FSK modes (default: 2)")
+    profile_options.add_argument('--rate', type=int,
+                                 help=f"sample rate in Hz (default: {RATE}; decode: the file's own)")
+    profile_options.add_argument('--duration', type=float,
+                                 help="symbol duration in seconds (default: depends on the modulation)")
+    profile_options.add_argument('--marker-duration', type=float, default=DURATION,
+                                 help=f"duration of each marker tone in seconds (default: {DURATION})")
+    demod_options = argparse.ArgumentParser(add_help=False)
+    demod_options.add_argument('--demod', choices=['fft', 'goertzel'], default='fft',
+                               help="FSK demodulator (default: fft)")
+
+    encode = commands.add_parser('encode', parents=[profile_options], help="encode data to a WAV file",
+                                 description="Encode data to a WAV file.")
+    encode.add_argument('input', help="file to encode, or - for standard input")
+    encode.add_argument('-o', '--output', default='-', help="WAV file to write, or - for standard output (default)")
+    encode.add_argument('--raw', action='store_true', help="send raw data instead of a frame")
+    encode.add_argument('--fec', action='store_true', help="protect the frame with Reed-Solomon codes")
+    encode.add_argument('--compress', choices=['auto', *FRAME_CODECS], help="compress the data before sending it")
+    encode.set_defaults(handler=run_encode)
+
+    decode = commands.add_parser('decode', parents=[profile_options, demod_options], help="decode a WAV file",
+                                 description="Decode a WAV file.")
+    decode.add_argument('input', help="WAV file to decode, or - for standard input")
+    decode.add_argument('-o', '--output', default='-', help="file to write, or - for standard output (default)")
+    decode.add_argument('--batched', action='store_true', help="decode FSK files in one pass over the whole file")
+    decode.add_argument('--raw', action='store_true', help="the data was sent raw, not as a frame")
+    decode.set_defaults(handler=run_decode)
+
+    listen = commands.add_parser('listen', parents=[profile_options, demod_options],
+                                 help="decode from the microphone", description="Decode from the microphone.")
+    listen.add_argument('-o', '--output', default='-', help="file to write, or - for standard output (default)")
+    listen.add_argument('--raw', action='store_true', help="the data is sent raw, not as a frame")
+    listen.set_defaults(handler=run_listen)
+
+    batch = commands.add_parser('batch', parents=[profile_options, demod_options],
+                                help="decode many WAV files in parallel",
+                                description="Decode WAV files, and the .wav files in directories, in parallel.")
+    batch.add_argument('paths', nargs='+', help="WAV files or directories to decode")
+    batch.add_argument('-o', '--output-dir', help="directory to save the .bin files in (default: next to each file)")
+    batch.add_argument('--manifest',
+                       help=f"JSON-lines manifest to write (default: {BATCH_MANIFEST} in the output directory)")
+    batch.add_argument('--workers', type=int, help="worker processes (default: the number of CPUs)")
+    batch.add_argument('--raw', action='store_true', help="the data was sent raw, not as a frame")
+    batch.set_defaults(handler=run_batch)
+
+    play = commands.add_parser('play', help="play a WAV file", description="Play a WAV file through the sound card.")
+    play.add_argument('input', help="WAV file to play, or - for standard input")
+    play.set_defaults(handler=run_play)
+    return parser
+
+# Function to run the command-line interface; without a command it falls back to the interactive prompts
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.command is None:
+        run_interactive()
+        return 0
+    # Standard output may carry the audio or the data, so progress messages go to standard error
+    stdin, stdout = sys.stdin.buffer, sys.stdout.buffer
+    with contextlib.redirect_stdout(sys.stderr):
+        try:
+            status = args.handler(args, stdin, stdout)
+        except (OSError, ValueError, wave.Error, ImportError) as error:
+            print(f"tranSSound {args.command}: {error}", file=sys.stderr)
+            return 1
+    return status or 0
+
+# Save decoded data to a file
+def save_decoded_data(decoded_data):
+    filename = input("Enter the filename to save the decoded data: ").strip()
+    with open(filename, 'wb') as file:
+        file.write(decoded_data)
+    print(f"Decoded data saved to {filename}")
+
+# Function to run encoding and decoding from interactive prompts
+def run_interactive():
+    action = input("Select an action (1 = Encode, 2 = Decode, 3 = Batch decode): ").strip()
+    
+    if action == "1":
+        print("You selected encoding.")
+        
+        # Prompt user for the file to encode or real-time option
+        mode = input("Choose encoding mode (1 = Real-time, 2 = File-based): ").strip()
+        
+        if mode == "1":
+            input_data = input("Enter text data to encode: ").strip()
+            data_to_encode = input_data.encode('utf-8')
+            filename = input("Enter the filename to save the encoded audio: ").strip()
+            encode_binary_to_audio(data_to_encode, filename)
+        
+        elif mode == "2":
+            input_data_filename = input("Enter the filename to read binary data to encode: ").strip()
+            filename = input("Enter the filename to save the encoded audio: ").strip()
+            with open(input_data_filename, 'rb') as f:
+                encode_binary_to_audio(f, filename)
+    
+    elif action == "2":
+        print("You selected decoding.")
+        
+        # Decode the audio from file or real-time
+        mode = input("Choose decoding mode (1 = Real-time, 2 = File-based, "
+                     "3 = All transmissions in a recording): ").strip()
+        
+        if mode == "1":
+            decoded_data = decode_audio_in_real_time()
+            save_decoded_data(decoded_data)
+        
+        elif mode == "2":
+            filename = input("Enter the filename of the audio to decode: ").strip()
+            decoded_data = decode_audio_from_file(filename)
+            save_decoded_data(decoded_data)
+
+        elif mode == "3":
+            filename = input("Enter the filename of the recording to decode: ").strip()
+            for i, (offset, data, error) in enumerate(decode_transmissions(filename)):
+                if error is not None:
+                    print(f"Transmission at sample {offset} failed: {error}")
+                    continue
+                output = f"{os.path.splitext(filename)[0]}_{i}.bin"
+                with open(output, 'wb') as file:
+                    file.write(data)
+                print(f"Transmission at sample {offset}: {len(data)} bytes saved to {output}")
+
+    elif action == "3":
+        print("You selected batch decoding.")
+        # One path per line, so paths may have spaces in them
+        print("Enter the WAV files or directories to decode, one per line, then an empty line:")
+        paths = [path.strip() for path in iter(input, '')]
+        output_dir = input("Enter the output directory (leave empty to save next to each recording): ").strip()
+        decode_batch(paths, output_dir or None)
+
+# Main function to run encoding and decoding
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,285 @@
+import bz2
+import json
+import lzma
+import tracemalloc
+import wave
+import zlib
+
+import numpy as np
+import pytest
+
+import Sound
+
+
+# Function to get one transmission of data as little-endian 16-bit PCM bytes, with silence on either side
+def transmission_pcm(data, profile, framed=True):
+    silence = bytes(2 * profile.rate // 10)
+    return silence + b''.join(Sound.Encoder(profile, framed=framed).encode(data)) + silence
+
+
+# Function to feed samples to a decoder in chunks of chunk_size and finish the stream; returns the payloads
+def feed_chunks(decoder, samples, chunk_size=Sound.CAPTURE_FRAMES):
+    payloads = []
+    for start in range(0, len(samples), chunk_size):
+        payloads += decoder.feed(samples[start:start + chunk_size])
+    return payloads + decoder.finish()
+
+
+# Function to write samples to a mono 16-bit WAV file
+def write_wav(path, samples, rate):
+    with wave.open(str(path), 'wb') as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(rate)
+        wav_file.writeframes(bytes(samples))
+
+
+def test_decoder_feed_keeps_samples_split_between_chunks():
+    profile = Sound.CodecProfile('fsk', 4)
+    pcm = transmission_pcm(b'fed in odd-sized chunks', profile)
+    # An odd chunk size splits a sample between every other pair of chunks
+    assert feed_chunks(Sound.Decoder(profile), pcm, 1001) == [b'fed in odd-sized chunks']
+
+
+def test_decoder_feed_allocates_no_arrays_in_steady_state():
+    profile = Sound.CodecProfile('fsk', 4)
+    data = bytes(range(256))
+    pcm = np.frombuffer(transmission_pcm(data, profile), dtype='<i2')
+    decoder = Sound.Decoder(profile)
+    # A first transmission grows the buffers to what one needs
+    assert feed_chunks(decoder, pcm) == [data]
+
+    # Searching a second of silence, and the data of the next transmission once it is under way, are the steady states;
+    # setting up for a transmission at its start marker and unwrapping it at its end allocate, so those chunks are fed
+    # untraced
+    samples = np.concatenate((np.zeros(profile.rate, dtype=np.int16), pcm))
+    traced = [range(0, profile.rate), range(profile.rate + len(pcm) // 2, len(samples) - profile.rate // 2)]
+    payloads = []
+    peaks = []
+    tracemalloc.start()
+    try:
+        for start in range(0, len(samples), Sound.CAPTURE_FRAMES):
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            payloads += decoder.feed(samples[start:start + Sound.CAPTURE_FRAMES])
+            if any(start in part for part in traced):
+                peaks.append(tracemalloc.get_traced_memory()[1] - before)
+    finally:
+        tracemalloc.stop()
+    payloads += decoder.finish()
+    assert payloads == [data]
+    # Python objects come and go, but not even one symbol window of samples is allocated
+    assert max(peaks) < 8 * profile.frames_per_symbol
+
+
+# Function to play samples back through a sound card whose clock runs ppm parts per million fast (band-limited, as a
+# sound card's own resampling is, so the tones near the top of the band leave no images). Silence is added at the end
+# until both FFT lengths only have small prime factors, which keeps the FFTs fast
+def resample(samples, ppm):
+    padded = len(samples)
+    while not is_smooth(padded) or not is_smooth(round(padded / (1 + ppm * 1e-6))):
+        padded += 1
+    count = round(padded / (1 + ppm * 1e-6))
+    resampled = np.fft.irfft(np.fft.rfft(samples, padded), count) * (count / padded)
+    return np.clip(np.rint(resampled), -32768, 32767).astype(np.int16)
+
+
+# Function to tell whether n has no prime factor above 100
+def is_smooth(n):
+    for factor in range(2, 100):
+        while n % factor == 0:
+            n //= factor
+    return n == 1
+
+
+def test_decoders_follow_the_symbol_clock_of_a_drifting_sender():
+    data = np.random.default_rng(3).bytes(3000)
+    for modulation in ('fsk', 'ofdm', 'dbpsk', 'dqpsk'):
+        profile = Sound.CodecProfile(modulation)
+        pcm = np.frombuffer(transmission_pcm(data, profile), dtype='<i2')
+        for ppm in (30, -30):
+            assert feed_chunks(Sound.Decoder(profile), resample(pcm, ppm)) == [data], (modulation, ppm)
+
+
+def test_search_marker_finds_the_start_marker_of_an_offset_sender():
+    profile = Sound.CodecProfile('fsk', 16)
+    noise = np.random.default_rng(5).normal(0, 300, profile.rate // 10).astype(np.int16)
+    pcm = np.concatenate((noise, np.frombuffer(transmission_pcm(b'offset sender', profile), dtype='<i2')))
+    lead = len(noise) + profile.rate // 10
+    for ppm in (500, -500, 2000, -2000):
+        offset = Sound.search_marker(resample(pcm, ppm), profile.start_marker, 0, profile)
+        assert abs(offset - lead / (1 + ppm * 1e-6)) <= 8, ppm
+
+
+def test_decoders_retune_to_an_offset_sender(tmp_path):
+    data = b'retuned to the sender'
+    noise = np.random.default_rng(5).normal(0, 300, Sound.RATE // 10).astype(np.int16)
+    for modulation, mfsk in (('fsk', 16), ('ofdm', 2)):
+        profile = Sound.CodecProfile(modulation, mfsk)
+        pcm = np.concatenate((noise, np.frombuffer(transmission_pcm(data, profile), dtype='<i2')))
+        for ppm in (2000, -2000):
+            samples = resample(pcm, ppm)
+            assert feed_chunks(Sound.Decoder(profile), samples) == [data], (modulation, ppm)
+            write_wav(tmp_path / 'offset.wav', samples, profile.rate)
+            decoded = Sound.decode_audio_from_file(str(tmp_path / 'offset.wav'), fallback=profile)
+            assert decoded == data, (modulation, ppm)
+
+
+def test_decoders_separate_transmissions_sent_back_to_back(tmp_path):
+    for modulation, mfsk in (('fsk', 2), ('fsk', 4), ('fsk', 16), ('ofdm', 2), ('dbpsk', 2), ('dqpsk', 2)):
+        profile = Sound.CodecProfile(modulation, mfsk)
+        for seed in range(3):
+            rng = np.random.default_rng(seed)
+            payloads = [rng.bytes(int(rng.integers(1, 200))) for _ in range(3)]
+            # One encoder's transmissions, with no gap between them, as a sender writing each one out as it comes
+            encoder = Sound.Encoder(profile)
+            silence = bytes(2 * profile.rate // 10)
+            pcm = silence + b''.join(b''.join(encoder.encode(data)) for data in payloads) + silence
+            assert feed_chunks(Sound.Decoder(profile), pcm) == payloads, (modulation, mfsk, seed)
+            write_wav(tmp_path / 'back_to_back.wav', pcm, profile.rate)
+            transmissions = Sound.decode_transmissions(str(tmp_path / 'back_to_back.wav'), mfsk=mfsk,
+                                                       modulation=modulation)
+            assert [data for offset, data, error in transmissions] == payloads, (modulation, mfsk, seed)
+
+
+# Function to decode one transmission with every decoder; returns each one's payload, or the FrameError it raised
+def decode_with_every_decoder(path, pcm, modulation, mfsk, framed=True):
+    profile = Sound.CodecProfile(modulation, mfsk)
+    write_wav(path, pcm, profile.rate)
+    results = []
+    for decode in (lambda: feed_chunks(Sound.Decoder(profile, framed=framed), pcm)[0],
+                   lambda: Sound.decode_audio_from_file(str(path), 'fft', fallback=profile, framed=framed),
+                   lambda: Sound.decode_audio_from_file(str(path), 'goertzel', fallback=profile, framed=framed),
+                   lambda: Sound.decode_audio_from_file(str(path), batched=True, fallback=profile, framed=framed)):
+        try:
+            results.append(decode())
+        except Sound.FrameError as error:
+            results.append(error)
+    [(offset, data, error)] = Sound.decode_transmissions(str(path), mfsk=mfsk, modulation=modulation, framed=framed)
+    results.append(data if error is None else Sound.FrameError(error))
+    return results
+
+
+def test_decoders_reject_a_frame_whose_header_is_damaged(tmp_path):
+    data = b'a frame with a damaged header'
+    frame = bytearray(b''.join(Sound.iter_frame_blocks(data, len(data), 0)))
+    for position in (1, 20, 70):
+        damaged = frame.copy()
+        damaged[position // 8] ^= 0x80 >> position % 8  # Bit 1 turns the magic 'TS' into 'VS'
+        for modulation, mfsk in (('fsk', 4), ('ofdm', 2), ('dbpsk', 2), ('dqpsk', 2)):
+            pcm = transmission_pcm(bytes(damaged), Sound.CodecProfile(modulation, mfsk), framed=False)
+            for result in decode_with_every_decoder(tmp_path / 'damaged.wav', pcm, modulation, mfsk):
+                assert isinstance(result, Sound.FrameError), (position, modulation, result)
+
+
+def test_decoders_return_raw_data_that_looks_like_a_frame(tmp_path):
+    data = b'TS raw data starting with the frame magic'
+    for modulation, mfsk in (('fsk', 4), ('ofdm', 2), ('dbpsk', 2), ('dqpsk', 2)):
+        pcm = transmission_pcm(data, Sound.CodecProfile(modulation, mfsk), framed=False)
+        results = decode_with_every_decoder(tmp_path / 'raw.wav', pcm, modulation, mfsk, framed=False)
+        assert results == [data] * 5, modulation
+
+
+def test_unframe_stops_decompressing_at_the_size_limit(monkeypatch):
+    data = bytes(1 << 20)
+    for codec, compress in (('zlib', zlib.compress), ('lzma', lzma.compress), ('bz2', bz2.compress)):
+        payload = compress(data)
+        frame = b''.join(Sound.iter_frame_blocks(payload, len(payload), Sound.FRAME_CODECS[codec]))
+        assert Sound.unframe(frame) == data
+        with pytest.raises(Sound.FrameError, match='expands past'):
+            Sound.unframe(frame, max_size=len(data) - 1)
+        monkeypatch.setattr(Sound, 'MAX_DECOMPRESSED_SIZE', len(data) // 2)
+        with pytest.raises(Sound.FrameError, match='expands past'):
+            Sound.unframe(frame)
+        monkeypatch.undo()
+
+
+def test_encoder_writes_rf64_past_the_riff_size_limit(tmp_path, monkeypatch):
+    data = b'written past the RIFF size limit'
+    path = str(tmp_path / 'encoded.wav')
+    Sound.encode_binary_to_audio(data, path)
+    with wave.open(path) as wav_file:
+        frames = wav_file.getnframes()
+    # A limit below the file's size stands in for 4 GiB
+    monkeypatch.setattr(Sound, 'RIFF_SIZE_LIMIT', 2 * frames)
+    Sound.encode_binary_to_audio(data, path)
+    with open(path, 'rb') as file:
+        assert file.read(4) == b'RF64'
+    with Sound.MappedWav(path) as wav_file:
+        assert wav_file.getnframes() == frames
+        assert wav_file.profile_data is not None
+    assert Sound.decode_audio_from_file(path) == data
+
+
+def test_batch_command_decodes_every_recording(tmp_path):
+    profile = Sound.CodecProfile('fsk', 4)
+    for name, data in (('one', b'first recording'), ('two', b'second recording')):
+        (tmp_path / name).mkdir()
+        write_wav(tmp_path / name / 'take.wav', transmission_pcm(data, profile), profile.rate)
+    write_wav(tmp_path / 'silence.wav', bytes(profile.rate), profile.rate)
+    output_dir = tmp_path / 'out'
+    assert Sound.main(['batch', str(tmp_path / 'one'), str(tmp_path / 'two'), str(tmp_path / 'silence.wav'),
+                       '-o', str(output_dir), '--mfsk', '4', '--workers', '2']) == 1
+
+    # Recordings of the same name get outputs of their own, and one without a transmission fails
+    with open(output_dir / Sound.BATCH_MANIFEST) as manifest:
+        records = {record['file']: record for record in map(json.loads, manifest)}
+    assert records[str(tmp_path / 'one' / 'take.wav')]['output'] == str(output_dir / 'take.bin')
+    assert records[str(tmp_path / 'two' / 'take.wav')]['output'] == str(output_dir / 'take_2.bin')
+    assert (output_dir / 'take.bin').read_bytes() == b'first recording'
+    assert (output_dir / 'take_2.bin').read_bytes() == b'second recording'
+    silence = records[str(tmp_path / 'silence.wav')]
+    assert not silence['ok'] and silence['error'] == "no transmission found"
+
+
+def test_codec_profile_rejects_timings_shorter_than_a_sample():
+    for options in ({'duration': -1}, {'duration': 1e-6}, {'marker_duration': 0}, {'rate': 0}, {'rate': -44100}):
+        with pytest.raises(ValueError):
+            Sound.CodecProfile(**options)
+    # An explicit --rate 0 is an error, not the default rate
+    args = Sound.build_parser().parse_args(['encode', '-', '--rate', '0'])
+    with pytest.raises(ValueError):
+        Sound.profile_from_args(args)
+    assert Sound.main(['encode', '-', '--marker-duration', '0']) == 1
+
+
+def test_file_decoders_find_a_quiet_transmission(tmp_path):
+    data = b'sent at a whisper'
+    for modulation, mfsk in (('fsk', 4), ('ofdm', 2), ('dbpsk', 2)):
+        profile = Sound.CodecProfile(modulation, mfsk)
+        pcm = np.frombuffer(transmission_pcm(data, profile), dtype='<i2')
+        # Scaled down to about 6.6 LSB RMS while the marker is sent, as from a sender turned almost all the way down
+        marker = pcm[profile.rate // 10:profile.rate // 10 + len(profile.start_marker) * profile.frames_per_marker_tone]
+        quiet = np.rint(pcm * (6.6 / np.sqrt(np.mean(marker.astype(np.float64) ** 2)))).astype(np.int16)
+        assert Sound.search_marker(quiet, profile.start_marker, 0, profile) is not None, modulation
+        write_wav(tmp_path / 'quiet.wav', quiet, profile.rate)
+        assert Sound.decode_audio_from_file(str(tmp_path / 'quiet.wav'), fallback=profile) == data, modulation
+
+
+def test_fec_frames_survive_a_256_byte_burst():
+    rng = np.random.default_rng(16)
+    block = Sound.FEC_INTERLEAVE_DEPTH * (Sound.RS_CODEWORD - Sound.RS_PARITY)
+    # A payload short enough to go out as the tail block alone, and one that fills a block and leaves a tail
+    for size in (300, block + 700):
+        data = rng.bytes(size)
+        frame = b''.join(Sound.iter_frame_blocks(data, len(data), Sound.FRAME_FLAG_FEC))
+        body = Sound.FRAME_HEADER.size + Sound.FEC_HEADER_PARITY
+        full = (size + Sound.FRAME_TRAILER.size) // block * Sound.FEC_INTERLEAVE_DEPTH * Sound.RS_CODEWORD
+        # Bursts at the start of the body, across the end of the full block (if any), and at the end of the tail
+        for start in (body, max(body + full - 128, body), len(frame) - 256):
+            damaged = bytearray(frame)
+            damaged[start:start + 256] = rng.bytes(256)
+            assert Sound.unframe(bytes(damaged)) == data, (size, start)
+
+
+def test_find_start_markers_rejects_the_end_markers_of_a_drifting_sender():
+    rng = np.random.default_rng(19)
+    for trial in range(12):
+        profile = Sound.CodecProfile('fsk', int(rng.choice([2, 4])))
+        payloads = [rng.bytes(int(rng.integers(20, 100))) for _ in range(2)]
+        pcm = b''.join(bytes(2 * int(rng.integers(5000, 20000))) + transmission_pcm(data, profile)
+                       for data in payloads)
+        ppm = rng.uniform(30, 80) * rng.choice([-1, 1])
+        samples = resample(np.frombuffer(pcm, dtype='<i2'), ppm)
+        # The end markers share most of their tones with the start markers, and must not be taken for a third one
+        assert len(Sound.find_start_markers(samples, profile)) == 2, (trial, ppm)